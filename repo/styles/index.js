@@ -33,7 +33,10 @@ function externalize() {
         document.querySelectorAll("a")[0].setAttribute("target","blank")
     }
 }
+// null when not in dark mode, so lazily loaded elements can be styled the same way
+var darkModeOled = null;
 function darkMode(isOled) {
+    darkModeOled = isOled;
     var darkColor = isOled ? "black" : "#161616";
     document.querySelector("body").style.color = "white";
     document.querySelector("body").style.background = darkColor;
@@ -43,4 +46,187 @@ function darkMode(isOled) {
 }
 if (navigator.userAgent.toLowerCase().indexOf("dark") != -1) {
     darkMode(navigator.userAgent.toLowerCase().indexOf("oled") != -1 || navigator.userAgent.toLowerCase().indexOf("pure-black") != -1);
-}
\ No newline at end of file
+}
+
+function packageElement(tweak) {
+    // Same markup as the packages rendered in index.jinja
+    var link = document.createElement("a");
+    link.className = "subtle_link";
+    link.href = "depiction/web/" + encodeURIComponent(tweak.package) + ".html";
+    link.innerHTML = '<div class="package"><img><div class="package_info"><p class="package_name"></p><p class="package_caption"></p></div></div>';
+    link.querySelector("img").src = "assets/" + encodeURIComponent(tweak.package) + "/icon.png";
+    link.querySelector(".package_name").textContent = tweak.name;
+    link.querySelector(".package_caption").textContent = tweak.author || "";
+    return link;
+}
+function lazyLoadPackages() {
+    // Only the first page of packages is in index.html, the next ones are loaded from api/pages/<n>.json
+    var loader = document.getElementById("load_more");
+    if (!loader) return;
+    var pageCount = parseInt(loader.getAttribute("data-page-count"));
+    var nextPage = 2;
+    var loading = false;
+    var observer = null;
+
+    function loadNextPage() {
+        if (loading || nextPage > pageCount) return;
+        loading = true;
+        var request = new XMLHttpRequest();
+        request.open("GET", "api/pages/" + nextPage + ".json");
+        request.onload = function() {
+            if (request.status != 200) return request.onerror();
+            var list = document.getElementById("package_list");
+            var tweaks = JSON.parse(request.responseText).tweaks;
+            for (var i = 0; i < tweaks.length; i++) {
+                list.appendChild(packageElement(tweaks[i]));
+            }
+            if (darkModeOled != null) darkMode(darkModeOled);
+            nextPage++;
+            loading = false;
+            if (nextPage > pageCount) {
+                loader.parentNode.removeChild(loader);
+                if (observer) observer.disconnect();
+            } else if (observer) {
+                // Fires again right away if the loader is still in view
+                observer.unobserve(loader);
+                observer.observe(loader);
+            }
+        };
+        request.onerror = function() {
+            loading = false;
+            loader.textContent = "Couldn't load more packages, tap to retry.";
+        };
+        request.send();
+    }
+
+    loader.onclick = loadNextPage;
+    if ("IntersectionObserver" in window) {
+        observer = new IntersectionObserver(function(entries) {
+            if (entries[0].isIntersecting) loadNextPage();
+        }, {rootMargin: "500px"});
+        observer.observe(loader);
+    } else {
+        loader.textContent = "Tap to load more packages";
+    }
+}
+lazyLoadPackages();
+
+// Search, w the index built by Repo.build_search_index (see utils/search.py).
+// Files are only downloaded when needed: the tweak list & the shards of the typed words.
+var MAX_SEARCH_RESULTS = 50;
+// file name -> {data, callbacks}
+var searchFiles = {};
+function searchTokens(text) {
+    // Same as tokenize() in utils/search.py
+    if (text.normalize) text = text.normalize("NFKD").replace(/[\u0300-\u036f]/g, "");
+    var tokens = text.toLowerCase().match(/[a-z0-9]+/g) || [];
+    return tokens.filter(function(token) { return token.length >= 2; });
+}
+function loadSearchFile(name, callback) {
+    var file = searchFiles[name];
+    if (file && file.data !== undefined) return callback(file.data);
+    if (file) return file.callbacks.push(callback);
+
+    file = searchFiles[name] = {callbacks: [callback]};
+    function done(data) {
+        for (var i = 0; i < file.callbacks.length; i++) file.callbacks[i](data);
+    }
+    var request = new XMLHttpRequest();
+    request.open("GET", "api/search/" + name + ".json");
+    request.onload = function() {
+        // No shard = no token starting w those characters
+        file.data = request.status == 200 ? JSON.parse(request.responseText) : {};
+        done(file.data);
+    };
+    request.onerror = function() {
+        delete searchFiles[name]; // retried on the next search
+        done({});
+    };
+    request.send();
+}
+function searchPackages(query, callback) {
+    var terms = searchTokens(query);
+    if (terms.length == 0) return callback(null);
+
+    var files = ["tweaks"];
+    for (var i = 0; i < terms.length; i++) {
+        if (files.indexOf(terms[i].substring(0, 2)) == -1) files.push(terms[i].substring(0, 2));
+    }
+    var loaded = {};
+    var remaining = files.length;
+    files.forEach(function(name) {
+        loadSearchFile(name, function(data) {
+            loaded[name] = data;
+            if (--remaining == 0) callback(rankPackages(terms, loaded));
+        });
+    });
+}
+function rankPackages(terms, loaded) {
+    // Every term has to match (as a prefix of a token), tweaks are ranked by the sum of their best matches' weights
+    var scores = null;
+    for (var i = 0; i < terms.length; i++) {
+        var shard = loaded[terms[i].substring(0, 2)];
+        var termScores = {};
+        for (var token in shard) {
+            if (token.lastIndexOf(terms[i], 0) != 0) continue;
+            var postings = shard[token];
+            var bonus = token == terms[i] ? 2 : 1; // whole words first
+            for (var j = 0; j < postings.length; j += 2) {
+                termScores[postings[j]] = Math.max(termScores[postings[j]] || 0, postings[j + 1] * bonus);
+            }
+        }
+        if (scores == null) {
+            scores = termScores;
+            continue;
+        }
+        var merged = {};
+        for (var id in scores) {
+            if (id in termScores) merged[id] = scores[id] + termScores[id];
+        }
+        scores = merged;
+    }
+
+    var tweaks = loaded["tweaks"];
+    var results = [];
+    for (var id in scores) {
+        if (!tweaks[id]) continue;
+        results.push({package: tweaks[id][0], name: tweaks[id][1], author: tweaks[id][2], score: scores[id]});
+    }
+    results.sort(function(a, b) {
+        return b.score - a.score || String(a.name).localeCompare(String(b.name));
+    });
+    return results.slice(0, MAX_SEARCH_RESULTS);
+}
+function setupSearch() {
+    var input = document.getElementById("search");
+    if (!input) return;
+    var results = document.getElementById("search_results");
+    var list = document.getElementById("package_list");
+    var lastSearch = 0;
+
+    input.oninput = function() {
+        var search = ++lastSearch;
+        searchPackages(input.value, function(tweaks) {
+            if (search != lastSearch) return; // a newer search is running
+            var searching = tweaks != null;
+            var loader = document.getElementById("load_more");
+            list.style.display = searching ? "none" : "";
+            if (loader) loader.style.display = searching ? "none" : "";
+            results.style.display = searching ? "" : "none";
+            results.innerHTML = "";
+            if (!searching) return;
+
+            if (tweaks.length == 0) {
+                var empty = document.createElement("p");
+                empty.className = "caption center";
+                empty.textContent = "No packages found.";
+                results.appendChild(empty);
+            }
+            for (var i = 0; i < tweaks.length; i++) {
+                results.appendChild(packageElement(tweaks[i]));
+            }
+            if (darkModeOled != null) darkMode(darkModeOled);
+        });
+    };
+}
+setupSearch();
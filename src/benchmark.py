@@ -0,0 +1,229 @@
+# Benchmarks every stage of a build on a generated repo, so changes can be compared across commits.
+# Usage: python src/benchmark.py --tweaks 50 --versions 3 --deb-size 1M [--compare benchmarks/<older run>.json]
+# Note: the repo is generated & built in a separate folder (--workdir), your repo/ & www/ aren't touched.
+
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+
+from utils import git
+from utils.synthetic_repo import MARKER_FILE, generate_repo
+
+SOURCE_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(size: str) -> int:
+    # Eg "512K", "1M" or "1048576"
+    unit = SIZE_UNITS.get(size[-1].upper())
+    if unit:
+        return int(float(size[:-1]) * unit)
+    return int(size)
+
+def get_peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+def get_commit() -> str | None:
+    try:
+        return git.run_git(["rev-parse", "--short", "HEAD"], cwd=SOURCE_FOLDER).decode().strip()
+    except Exception:
+        return None
+
+
+class StageTimer:
+    """
+    Times named stages & records the peak RSS (so far) at the end of each one.
+    """
+    stages: dict[str, dict[str, Any]]
+
+    def __init__(self) -> None:
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, name: str):
+        logging.info(f"Running stage {name}")
+        result: dict[str, Any] = {}
+        start = time.perf_counter()
+        yield result # extra data (eg bytes written) can be added to it
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        result["peak_rss_mb"] = get_peak_rss_mb()
+        self.stages[name] = result
+
+
+def prepare_workdir(args) -> None:
+    # Generating big repos is slow, so an already generated one w the same parameters is reused.
+    parameters = {"tweaks": args.tweaks, "versions": args.versions, "deb_size": args.deb_size, "screenshots": args.screenshots, "seed": args.seed}
+    parameters_path = f"{args.workdir}/{MARKER_FILE}"
+    if os.path.isfile(parameters_path):
+        with open(parameters_path) as f:
+            if json.load(f) == parameters:
+                logging.info(f"Reusing the repo generated in {args.workdir}")
+                return
+
+    logging.info(f"Generating a repo w {args.tweaks} tweaks * {args.versions} versions in {args.workdir}")
+    generate_repo(args.workdir, f"{SOURCE_FOLDER}/../repo/styles", args.tweaks, args.versions, args.deb_size, args.screenshots, args.seed)
+    with open(parameters_path, "w") as f:
+        json.dump(parameters, f)
+
+def clean_outputs() -> None:
+    for folder in ("www", "cache"):
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+
+def run_stages(build_workers: int) -> StageTimer:
+    # Imported here as RepoSettings loads repo/settings.json (from the workdir) on import
+    from datatypes.raw.control_file import ControlFile
+    from datatypes.repo import Repo
+    from datatypes.static.repo_settings import RepoSettings
+    from parsers.parse_all_packages import discover_packages
+    from utils.compression import COMPRESSORS
+    from utils.hash import hash_file_all_algorithms
+    from utils.index_writer import IndexWriter
+    from utils.workers import run_build_jobs
+
+    timer = StageTimer()
+    clean_outputs()
+
+    with timer.measure("discovery") as result:
+        # Cold (empty control index), so this includes reading every deb's control
+        tweaks = discover_packages()
+        packages = [package for tweak in tweaks for package in tweak.packages]
+        result["debs"] = len(packages)
+
+    with timer.measure("from_deb") as result:
+        for package in packages:
+            ControlFile.properties_from_deb(package.initial_path)
+        result["deb_bytes"] = sum(os.path.getsize(package.initial_path) for package in packages)
+
+    repo = Repo(tweaks, 1)
+    repo.setup_folders()
+
+    with timer.measure("patching") as result:
+        # Includes hashing the output as it's written
+        bytes_written = 0
+        for package in packages:
+            _, size, package.packages_stanza = package.build_patched_file()
+            bytes_written += size
+        result["bytes_written"] = bytes_written
+
+    with timer.measure("hashing") as result:
+        for package in packages:
+            hash_file_all_algorithms(package.final_path)
+        result["bytes_read"] = bytes_written
+
+    packages_path = f"{RepoSettings.build_folder}/Packages"
+    with timer.measure("packages") as result:
+        with IndexWriter(packages_path, {}) as writer:
+            for package in packages:
+                writer.write(f"{package.packages_stanza}\n")
+        result["bytes_written"] = os.path.getsize(packages_path)
+
+    with timer.measure("compression") as result:
+        with open(packages_path, "rb") as f:
+            packages_data = f.read()
+        for extension, level in RepoSettings.compression.items():
+            start = time.perf_counter()
+            compressor = COMPRESSORS[extension][1](level)
+            compressed_size = len(compressor.compress(packages_data)) + len(compressor.flush())
+            result[extension] = {"level": level, "seconds": round(time.perf_counter() - start, 4), "bytes_written": compressed_size}
+
+    with timer.measure("release"):
+        repo.packages_files_hashes.update(writer.results)
+        repo.build_release_file()
+
+    with timer.measure("html"):
+        repo.copy_static_files()
+        repo.build_cname()
+        repo.build_html_index()
+        repo.build_html_404()
+        repo.build_html_add()
+        repo.build_sileo_featured()
+
+    with timer.measure("depictions"):
+        for tweak in tweaks:
+            tweak.load_screenshot_box(repo.cache)
+            tweak.build_native_depiction()
+            tweak.build_web_depiction()
+            tweak.copy_assets()
+
+    with timer.measure("images") as result:
+        image_jobs = [job for tweak in tweaks for job in tweak.get_image_jobs(repo.cache)]
+        run_build_jobs(image_jobs, 1)
+        result["images"] = len(image_jobs)
+
+    # Whole builds, the way they'd run normally (w the worker pool & caches)
+    clean_outputs()
+    with timer.measure("full_build_cold") as result:
+        Repo(discover_packages(), build_workers).build_entire_repo(publish=False)
+        result["workers"] = build_workers
+    with timer.measure("full_build_warm") as result:
+        Repo(discover_packages(), build_workers).build_entire_repo(publish=False)
+        result["workers"] = build_workers
+
+    return timer
+
+def print_results(results: dict[str, Any], previous: dict[str, Any] | None) -> None:
+    logging.info(f"{'Stage':<18}{'Time (s)':>10}{'Peak RSS (MB)':>15}{'Previous (s)':>14}{'Change':>9}")
+    for name, stage in results["stages"].items():
+        line = f"{name:<18}{stage['seconds']:>10.3f}{stage['peak_rss_mb']:>15.1f}"
+        previous_stage = previous["stages"].get(name) if previous else None
+        if previous_stage:
+            change = (stage["seconds"] - previous_stage["seconds"]) / max(previous_stage["seconds"], 1e-9) * 100
+            line += f"{previous_stage['seconds']:>14.3f}{change:>+8.1f}%"
+        logging.info(line)
+    logging.info(f"Peak RSS: {results['peak_rss_mb']} MB (workers: {results['peak_children_rss_mb']} MB)")
+
+def main(args):
+    args.workdir = os.path.abspath(args.workdir or f"{tempfile.gettempdir()}/aurixa_benchmark")
+    output_path = os.path.abspath(args.output or f"benchmarks/{datetime.now().strftime('%Y-%m-%d_%H.%M.%S')}_{get_commit() or 'unknown'}.json")
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    prepare_workdir(args)
+    os.chdir(args.workdir)
+    timer = run_stages(args.jobs or os.cpu_count() or 1)
+
+    results = {
+        "commit": get_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "parameters": {"tweaks": args.tweaks, "versions": args.versions, "deb_size": args.deb_size, "screenshots": args.screenshots, "seed": args.seed},
+        "stages": timer.stages,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "peak_children_rss_mb": get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=4)
+
+    print_results(results, previous)
+    logging.info(f"Results saved to {output_path}")
+
+if __name__ == "__main__":
+    import argparse
+    from utils.logger import load_proper_logger
+    load_proper_logger(logging.getLogger(), False)
+
+    parser = argparse.ArgumentParser(description="Benchmarks Aurixa's build stages on a generated repo")
+    parser.add_argument("--tweaks", type=int, default=50, help="number of generated tweaks")
+    parser.add_argument("--versions", type=int, default=3, help="number of versions (debs) per tweak")
+    parser.add_argument("--deb-size", type=parse_size, default=parse_size("1M"), help="size of the data in every deb (eg 512K, 1M)")
+    parser.add_argument("--screenshots", type=int, default=2, help="number of screenshots per tweak")
+    parser.add_argument("--seed", type=int, default=0, help="seed used to generate the repo")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes used for the full builds (default: CPU count)")
+    parser.add_argument("--workdir", default=None, help="folder the repo is generated & built in (default: <tmp>/aurixa_benchmark)")
+    parser.add_argument("--output", default=None, help="path of the results json (default: benchmarks/<date>_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="results json of a previous run to compare against")
+
+    main(parser.parse_args())
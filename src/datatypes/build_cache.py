@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Any
+
+from utils import tracing
+from utils.hash import hash_file_sha256
+from utils.images import read_image_size
+
+CACHE_VERSION = 1
+
+class BuildCache:
+    """
+    Persistent cache of the results of the previous builds, used to skip unchanged packages.
+
+    Patched packages are content addressed: they're keyed by the digest of their source deb
+    plus their final control text & path, so any change to either rebuilds them.
+    """
+    file_path: str
+    # source deb path -> {"size", "mtime", "sha256"}, avoids rehashing unchanged source debs
+    sources: dict[str, dict[str, Any]]
+    # package key -> {"hashes", "size", "stanza"}
+    packages: dict[str, dict[str, Any]]
+    # index file (eg "Packages") -> {"sha256", "levels", "files": {filename: [hashes, size]}}
+    indexes: dict[str, dict[str, Any]]
+    # tweak folder name -> fingerprint of its last built depictions & assets
+    tweaks: dict[str, str]
+    # output path -> [size, mtime, options, sha256] of the file after it's been post processed (minified/precompressed)
+    outputs: dict[str, list]
+    # source image digest -> [width, height], so screenshots don't need to be opened to get their display size
+    image_sizes: dict[str, list[int]]
+    _used_sources: set[str]
+    _used_package_keys: set[str]
+    _used_tweaks: set[str]
+    _used_outputs: set[str]
+    _used_image_sizes: set[str]
+    # names of the folders in <cache folder>/images/ used during this run, see utils/images.py
+    _used_image_folders: set[str]
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._used_sources = set()
+        self._used_package_keys = set()
+        self._used_tweaks = set()
+        self._used_outputs = set()
+        self._used_image_sizes = set()
+        self._used_image_folders = set()
+        self._load_data()
+
+    def _load_data(self) -> None:
+        data = {}
+        if os.path.isfile(self.file_path):
+            try:
+                with open(self.file_path) as cache_file:
+                    data = json.load(cache_file)
+            except:
+                logging.warn(f"Couldn't read the build cache at '{self.file_path}', starting from an empty one.")
+                data = {}
+
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            data = {}
+
+        self.sources = data.get("sources", {})
+        self.packages = data.get("packages", {})
+        self.indexes = data.get("indexes", {})
+        self.tweaks = data.get("tweaks", {})
+        self.outputs = data.get("outputs", {})
+        self.image_sizes = data.get("image_sizes", {})
+
+    def save(self) -> None:
+        # Only keep what's been used during this run so the cache doesn't grow forever
+        self.sources = {path: value for path, value in self.sources.items() if path in self._used_sources}
+        self.packages = {key: value for key, value in self.packages.items() if key in self._used_package_keys}
+        self.tweaks = {key: value for key, value in self.tweaks.items() if key in self._used_tweaks}
+        self.outputs = {path: value for path, value in self.outputs.items() if path in self._used_outputs}
+        self.image_sizes = {digest: value for digest, value in self.image_sizes.items() if digest in self._used_image_sizes}
+
+        folder = os.path.dirname(self.file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._prune_image_folders(f"{folder or '.'}/images")
+
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump({
+                "version": CACHE_VERSION,
+                "sources": self.sources,
+                "packages": self.packages,
+                "indexes": self.indexes,
+                "tweaks": self.tweaks,
+                "outputs": self.outputs,
+                "image_sizes": self.image_sizes,
+            }, cache_file)
+        os.replace(tmp_path, self.file_path)
+
+    # SOURCES
+    def get_source_digest(self, path: str) -> str:
+        self._used_sources.add(path)
+        stat = os.stat(path)
+        entry = self.sources.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            tracing.add_cache_result("source digests", True)
+            return entry["sha256"]
+
+        tracing.add_cache_result("source digests", False)
+
+        digest = hash_file_sha256(path)
+        self.sources[path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": digest}
+        return digest
+
+    # PACKAGES
+    def get_content_key(self, source_path: str, control_text: str) -> str:
+        # Same key = same patched deb, whatever its path
+        key_hash = hashlib.sha256()
+        for part in (self.get_source_digest(source_path), control_text):
+            key_hash.update(part.encode())
+            key_hash.update(b"\0")
+        return key_hash.hexdigest()
+
+    def get_package_key(self, source_path: str, control_text: str, final_path: str) -> str:
+        key_hash = hashlib.sha256()
+        for part in (self.get_source_digest(source_path), final_path, control_text):
+            key_hash.update(part.encode())
+            key_hash.update(b"\0")
+        return key_hash.hexdigest()
+
+    def get_package(self, key: str) -> dict[str, Any] | None:
+        self._used_package_keys.add(key)
+        return self.packages.get(key)
+
+    def set_package(self, key: str, hashes: dict[str, str], size: int, stanza: str) -> None:
+        self._used_package_keys.add(key)
+        self.packages[key] = {"hashes": hashes, "size": size, "stanza": stanza}
+
+    # TWEAKS
+    def get_tweak_fingerprint(self, folder_name: str) -> str | None:
+        self._used_tweaks.add(folder_name)
+        return self.tweaks.get(folder_name)
+
+    def set_tweak_fingerprint(self, folder_name: str, fingerprint: str) -> None:
+        self._used_tweaks.add(folder_name)
+        self.tweaks[folder_name] = fingerprint
+
+    # OUTPUTS
+    def get_output(self, path: str) -> list | None:
+        self._used_outputs.add(path)
+        return self.outputs.get(path)
+
+    def set_output(self, path: str, size: int, mtime: int, digest: str, options: list) -> None:
+        self._used_outputs.add(path)
+        self.outputs[path] = [size, mtime, options, digest]
+
+    # IMAGES
+    def get_image_size(self, path: str) -> tuple[int, int]:
+        digest = self.get_source_digest(path)
+        self._used_image_sizes.add(digest)
+        size = self.image_sizes.get(digest)
+        tracing.add_cache_result("image sizes", size is not None)
+        if size is None:
+            size = list(read_image_size(path))
+            self.image_sizes[digest] = size
+        return size[0], size[1]
+
+    def use_image_folder(self, folder: str) -> None:
+        self._used_image_folders.add(os.path.basename(folder))
+
+    def _prune_image_folders(self, images_folder: str) -> None:
+        # Variants of replaced/removed images (& leftovers of interrupted runs)
+        if not os.path.isdir(images_folder):
+            return
+        for name in os.listdir(images_folder):
+            if name not in self._used_image_folders:
+                logging.debug(f"Removing unused cached images {images_folder}/{name}")
+                shutil.rmtree(f"{images_folder}/{name}", ignore_errors=True)
+
+    # INDEXES
+    def get_index(self, name: str, sha256: str, levels: dict[str, int]) -> dict[str, tuple[dict[str, str], int]] | None:
+        """
+        Returns the files built last time for that index if its content & compression levels didn't change.
+        """
+        entry = self.indexes.get(name)
+        if not entry or entry["sha256"] != sha256 or entry["levels"] != levels:
+            return None
+        return {filename: (hashes, size) for filename, (hashes, size) in entry["files"].items()}
+
+    def set_index(self, name: str, sha256: str, levels: dict[str, int], files: dict[str, tuple[dict[str, str], int]]) -> None:
+        self.indexes[name] = {"sha256": sha256, "levels": levels, "files": files}
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import sqlite3
+
+from packaging import version
+from packaging.version import Version
+
+from datatypes.raw.control_file import ControlFile
+from utils import tracing
+
+# Bump when the stored data changes, the index is then rebuilt from scratch
+INDEX_VERSION = 1
+
+class ControlIndex:
+    """
+    On disk index of the control files of all source debs, so unchanged debs don't have to be opened on every run.
+    Entries are keyed by path & checked against the deb's size, mtime & inode.
+    """
+    file_path: str
+    _db: sqlite3.Connection
+    _seen_paths: set[str]
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._seen_paths = set()
+
+        folder = os.path.dirname(file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self._db = sqlite3.connect(file_path)
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS controls")
+            self._db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS controls (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                properties TEXT NOT NULL,
+                version TEXT NOT NULL
+            )
+        """)
+
+    def get_control(self, deb_path: str) -> tuple[ControlFile, Version]:
+        """
+        Returns the control & parsed version of the given deb, reading the deb only if it changed since last time.
+        """
+        self._seen_paths.add(deb_path)
+        stat = os.stat(deb_path)
+        row = self._db.execute(
+            "SELECT properties, version FROM controls WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            (deb_path, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        ).fetchone()
+
+        tracing.add_cache_result("control index", row is not None)
+        if row:
+            properties = json.loads(row[0])
+            return ControlFile(properties), Version(row[1])
+
+        logging.debug(f"Control index miss for {deb_path}, reading the deb")
+        properties = ControlFile.properties_from_deb(deb_path)
+        control = ControlFile(properties)
+        parsed_version = version.parse(str(control.get_property("Version")))
+        self._db.execute(
+            "INSERT OR REPLACE INTO controls (path, size, mtime_ns, inode, properties, version) VALUES (?, ?, ?, ?, ?, ?)",
+            (deb_path, stat.st_size, stat.st_mtime_ns, stat.st_ino, json.dumps(properties), str(parsed_version))
+        )
+        return control, parsed_version
+
+    def close(self, prune: bool = True) -> None:
+        """
+        prune: forget about debs that weren't looked up since the index was opened
+        """
+        if prune:
+            known_paths = [row[0] for row in self._db.execute("SELECT path FROM controls")]
+            self._db.executemany("DELETE FROM controls WHERE path = ?", [(path,) for path in known_paths if path not in self._seen_paths])
+        self._db.commit()
+        self._db.close()
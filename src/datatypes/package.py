@@ -1,19 +1,19 @@
-import hashlib
-import io
 import logging
 import os
-import random
-import shutil
-import subprocess
-import tarfile
-from typing import Callable, cast
+from typing import IO, cast
 
+from datatypes.build_cache import BuildCache
+from datatypes.control_index import ControlIndex
 from datatypes.raw.control_file import ControlFile
 from packaging import version
 from packaging.version import Version
 
 from datatypes.static.repo_settings import RepoSettings
-from utils.hash import hash_file_all_algorithms
+from utils.deb import patch_deb_control, read_build_time
+from utils import tracing
+from utils.hash import HashingWriter
+from utils.tracing import traced
+from utils.workers import BuildJob
 
 class Package:
     """
@@ -24,34 +24,82 @@ class Package:
     final_path: str
     control: ControlFile
     version: Version
-    def __init__(self, folder_name: str, deb_name: str) -> None:
+    packages_stanza: str | None
+    # Set when another package makes the exact same deb, which is then the only one built & published (see Repo.deduplicate_packages)
+    duplicate_of: "Package | None"
+    # Moved out of the main Packages file by the retention policy, published in the archive instead
+    archived: bool
+    def __init__(self, folder_name: str, deb_name: str, control_index: ControlIndex | None = None) -> None:
         logging.debug(f"Loading deb {deb_name} for {folder_name}")
         self.deb_name = deb_name
         self.initial_path = f"repo/packages/{folder_name}/{deb_name}"
         self.final_path = f"{RepoSettings.build_folder}/debs/{self.deb_name}"
 
-        self.control = ControlFile.from_deb(self.initial_path)
-        self.version = version.parse(cast(str, self.control.get_property("Version")))
-    
-    def patch_copy_deb_file(self):
-        # NOTE: THIS IS LINUX ONLY FOR NOW!
-        # ALSO, IF POSSIBLE, FIND A WAY TO EDIT ARCHIVES ON THE FLY & NOT RECOMPRESS.
-        # neither arpy or unix_ar seem to support it unfortunately so for now sticking w good old shell
-        tmpfolder = f"tmp/{random.randint(1000000, 10000000)}"
-        os.makedirs(tmpfolder)
-
-        # extract
-        subprocess.run(f"dpkg-deb -R {self.initial_path} {tmpfolder}", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-        # edit control
-        with open(f"{tmpfolder}/DEBIAN/control", "w") as f:
-            f.write(self.control.to_text())
-        # re package
-        subprocess.run(f"dpkg-deb -b {tmpfolder} {self.final_path}", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-
-        shutil.rmtree(tmpfolder)
+        if control_index:
+            self.control, self.version = control_index.get_control(self.initial_path)
+        else:
+            self.control = ControlFile.from_deb(self.initial_path)
+            self.version = version.parse(cast(str, self.control.get_property("Version")))
+        self.packages_stanza = None
+        self.duplicate_of = None
+        self.archived = False
+
+    def set_archived(self, archived: bool) -> None:
+        self.archived = archived
+        folder = "archive/debs" if archived else "debs"
+        # Filename stays "./debs/<deb>", the archive being a repo of its own in archive/
+        self.final_path = f"{RepoSettings.build_folder}/{folder}/{self.deb_name}"
+
+    def get_build_time(self) -> float:
+        # Falls back to the file's mtime for debs without a build time in them
+        return read_build_time(self.initial_path) or os.path.getmtime(self.initial_path)
+
+    def get_build_job(self, cache: BuildCache) -> BuildJob | None:
+        """
+        Returns the job patching & copying the deb to the build folder & preparing its entry in the Packages file.
+        Returns None if the cache already has the same deb w the same control built & the output is still there,
+        or if it's a duplicate.
+        """
+        if self.duplicate_of:
+            return None
+        key = cache.get_package_key(self.initial_path, self.control.to_text(), self.final_path)
+        cached = cache.get_package(key)
+        hit = bool(cached and os.path.isfile(self.final_path) and os.path.getsize(self.final_path) == cached["size"])
+        tracing.add_cache_result("debs", hit)
+        if cached and hit:
+            logging.debug(f"Using cached build for deb {self.deb_name}")
+            self.packages_stanza = cached["stanza"]
+            return None
+
+        def on_done(result: tuple[dict[str, str], int, str]):
+            hashes, size, self.packages_stanza = result
+            cache.set_package(key, hashes, size, self.packages_stanza)
+
+        return BuildJob(f"deb {self.initial_path}", self.build_patched_file, on_done)
+
+    def build_patched_file(self) -> tuple[dict[str, str], int, str]:
+        # Can run in a worker process, so results are returned instead of being set on self.
+        hashes, size = self.patch_copy_deb_file()
+
+        additional_control_properties: dict[str, str] = dict(hashes)
+        additional_control_properties["Size"] = str(size)
+        additional_control_properties["Filename"] = f"./debs/{self.deb_name}"
+
+        return hashes, size, self.control.to_text(additional_control_properties)
     
-    def hash_patched_file(self) -> dict[str, str]:
-        return hash_file_all_algorithms(self.final_path)
+    @traced()
+    def patch_copy_deb_file(self) -> tuple[dict[str, str], int]:
+        """
+        Returns the hashes & size of the patched deb, computed while writing it.
+        """
+        # Only the control member gets rebuilt, the data member is copied as is
+        # (no extraction/recompression w dpkg-deb anymore).
+        # Written to a temporary file first so that an interrupted build never leaves a half written deb.
+        tmp_path = f"{self.final_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            writer = HashingWriter(f)
+            patch_deb_control(self.initial_path, cast(IO[bytes], writer), self.control.to_text())
+        os.replace(tmp_path, self.final_path)
 
-    def size_patched_file(self) -> int:
-        return os.path.getsize(f"{self.final_path}")
\ No newline at end of file
+        tracing.add_bytes(read=os.path.getsize(self.initial_path), written=writer.size)
+        return writer.hexdigests(), writer.size
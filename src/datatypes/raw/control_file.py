@@ -2,11 +2,10 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 import logging
-import tarfile
-from typing import IO, Any, Callable, cast
-import arpy
+from typing import Any, Callable
 
 from datatypes.static.repo_settings import RepoSettings
+from utils.deb import read_control_text
 
 # Used to check for absolutely necessary unreplaceable keys when making a new ControlFile object
 ESSENTIAL_CONTROL_KEYS = (
@@ -115,20 +114,17 @@ class ControlFile:
 
 
     def to_text(self, additional_properties: dict | None = None) -> str:
-        final_text = ""
-        for prop, value in self._properties.items():
-            final_text += f"{prop}: {value}\n"
+        lines = [f"{prop}: {value}\n" for prop, value in self._properties.items()]
         
         if isinstance(additional_properties, dict):
-            for prop, value in additional_properties.items():
-                final_text += f"{prop}: {value}\n"
+            lines += [f"{prop}: {value}\n" for prop, value in additional_properties.items()]
 
-        return final_text
+        return "".join(lines)
 
 
     # STATIC PUBLIC
-    @classmethod
-    def from_text(cls, control_text: str) -> ControlFile:
+    @staticmethod
+    def properties_from_text(control_text: str) -> dict[str, str]:
         # Note: this does NOT support control files with multi line properties (yet)
         # iirc my ios repo archiver does support that, might yoink it from there.
         control_properties = {}
@@ -145,24 +141,21 @@ class ControlFile:
             start, end = linesplit
             control_properties[start] = end
             
-        return ControlFile(control_properties)
+        return control_properties
 
-    @classmethod
-    def from_deb(cls, full_path: str) -> ControlFile:
+    @staticmethod
+    def properties_from_deb(full_path: str) -> dict[str, str]:
+        # Only reads the deb up to its control member, see utils/deb.py
         try:
-            root_ar = arpy.Archive(full_path)
-            root_ar.read_all_headers()
-            control_bin = root_ar.archived_files[b'control.tar.gz']
-            control_bin = cast(IO[bytes], control_bin) # casts r dirty in python, required for next line otherwise py type complain
-            control_tar = tarfile.open(fileobj=control_bin) 
-            try:
-                control_data = control_tar.extractfile("./control").read().decode() #type: ignore - if None, catch the error anyways.
-            except Exception as e:
-                logging.error(f"Control file couldn't be read inside of deb {full_path}.")
-                raise e
-            
-            return cls.from_text(control_data)
-
+            return ControlFile.properties_from_text(read_control_text(full_path))
         except Exception as e:
-            logging.error(f"Reading control file from deb failed:")
-            raise e
\ No newline at end of file
+            logging.error(f"Reading control file from deb {full_path} failed:")
+            raise e
+
+    @classmethod
+    def from_text(cls, control_text: str) -> ControlFile:
+        return cls(cls.properties_from_text(control_text))
+
+    @classmethod
+    def from_deb(cls, full_path: str) -> ControlFile:
+        return cls(cls.properties_from_deb(full_path))
\ No newline at end of file
@@ -4,6 +4,9 @@ import os
 from packaging import version
 from packaging.version import Version
 
+from utils.input import is_interactive
+from utils.report import report_issue
+
 # Could use some inheritance between this & TweakInfo for the _load_data function but meh
 class TweakChangelog:
     file_path: str
@@ -37,6 +40,14 @@ class TweakChangelog:
         for i, elem in enumerate(data): # data & sorted_data same length
             v1 = elem["version"]
             v2 = sorted_data[i]["version"]
+            if v1 != v2 and not is_interactive():
+                # Unattended builds keep going, the issue is in the build report
+                report_issue(
+                    "changelog_order",
+                    f"Changelog '{self.file_path}' isn't ordered properly (mismatched version: {v1} (provided)/ {v2} (sorted))",
+                    path=self.file_path, provided=v1, expected=v2
+                )
+                return True
             if v1 != v2:
                 logging.warn(f"Looks like your changelog isn't ordered properly for file '{self.file_path}' !")
                 logging.warn(f"Mismatched version: {v1} (provided)/ {v2} (sorted)")
@@ -2,6 +2,8 @@ import json
 import os
 from typing import Any
 
+from utils.retention import RetentionPolicy, get_retention_policy
+
 
 class TweakInfo:
     file_path: str
@@ -10,6 +12,8 @@ class TweakInfo:
     max_ios: str | None
     version_range: str | None
     source: str | None
+    # overrides the one in the settings
+    retention: RetentionPolicy | None
     def __init__(self, file_path: str) -> None:
         self.file_path = file_path
         self.data = self._load_data()
@@ -43,6 +47,7 @@ class TweakInfo:
             self.version_range = "Unknown"
         
         self.source = data.get("source")
+        self.retention = get_retention_policy(data.get("retention"), self.file_path)
     
     def get_info_dict(self) -> dict[str, Any]:
         return {
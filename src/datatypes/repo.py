@@ -1,27 +1,53 @@
-import bz2
+import hashlib
 import json
 import logging
-import lzma
 import os
 import random
 import shutil
 import subprocess
-from typing import Callable
+from functools import partial
+from typing import Any, cast
 
-import jinja2
+from datatypes.build_cache import BuildCache
+from datatypes.package import Package
 from datatypes.static.repo_settings import RepoSettings
 from datatypes.tweak import Tweak
+from utils import git, tracing
+from utils.by_hash import publish_by_hash, remove_by_hash
+from utils.compression import remove_disabled_formats
 from utils.hash import hash_file_all_algorithms
-from utils.input import log_input
+from utils.index_writer import IndexWriter
+from utils.input import is_interactive, log_input
+from utils.manifest import build_manifest, diff_manifests, load_manifest, write_json
+from utils.minify import MINIFIERS
+from utils.pdiff import remove_diffs, update_diffs
+from utils.postprocess import POSTPROCESS_VERSION, brotli, get_postprocessed_files, postprocess_file, remove_stale_sidecars, strip_sidecar_extension
+from utils.search import build_search_shards, get_tweak_tokens
+from utils.sync import sync_file, write_file_if_changed
+from utils.templates import render_template_to_file
+from utils.tracing import traced
+from utils.workers import BuildJob, run_build_jobs
+
+# Folders (relative to the build folder) that can have by-hash files, see utils/by_hash.py
+BY_HASH_FOLDERS = {"", "Packages.diff"}
 
 
 class Repo:
     bf: str = RepoSettings.build_folder #easier access
     tweaks: list[Tweak]
     featured_tweaks: list[Tweak]
-    def __init__(self, tweaks: list[Tweak]) -> None:
+    cache: BuildCache
+    build_workers: int
+    # filename -> (hashes, size) of the Packages files, filled as they're written
+    packages_files_hashes: dict[str, tuple[dict[str, str], int]]
+    _pages_context: dict[str, Any] | None
+    def __init__(self, tweaks: list[Tweak], build_workers: int | None = None) -> None:
         logging.debug("Making new repo object")
         self.tweaks = tweaks
+        self.build_workers = build_workers or RepoSettings.build_workers
+        self.cache = BuildCache(f"{RepoSettings.cache_folder}/build_cache.json")
+        self.packages_files_hashes = {}
+        self._pages_context = None
         self.featured_tweaks = self._load_featured_tweaks()
         if not os.path.exists("www"):
             logging.debug("Making www folder")
@@ -42,8 +68,12 @@ class Repo:
         
         return featured
 
-    def build_entire_repo(self):
-        if RepoSettings.git_repo:
+    @traced()
+    def build_entire_repo(self, publish: bool = True):
+        """
+        publish: whether to pull/commit the git repo (if any)
+        """
+        if publish and RepoSettings.git_repo:
             self.init_git()
         
         self.setup_folders()
@@ -55,43 +85,45 @@ class Repo:
         self.build_html_404()
         self.build_html_add()
         self.build_sileo_featured()
+        self.build_api()
+        self.build_search_index()
 
-        for tweak in self.tweaks:
-            tweak.build_entire_tweak_in_repo()
+        self.build_tweaks()
+        self.prune_stale_outputs()
+        self.postprocess_outputs()
 
         self.build_packages_file()
-        self.compress_packages_file()
+        self.build_archive()
+        self.publish_by_hash()
+        with tracing.span("BuildCache.save"):
+            self.cache.save()
 
-        self.build_release_file()
+        release_changed = self.build_release_file()
         if RepoSettings.enable_gpg:
-            self.sign_release_file()
+            self.sign_release_file(release_changed)
+        else:
+            self.remove_release_signatures()
+
+        self.write_build_manifest()
         
-        if RepoSettings.git_repo:
+        if publish and RepoSettings.git_repo:
             self.prompt_commit()
-        
-        # TODO: api thing?
 
+
+    @traced()
     def init_git(self):
-        # Note: not sure if there's a better way to do it, basically:
+        # Basically:
         # - git clone (if not exists) or pull
-        # - remove everything except .git
-        # then at the end see "self.prompt_commit()"
+        # - build on top of the existing worktree, only rewriting what changed (see self.prune_stale_outputs())
+        # then at the end see "self.prompt_commit()", which only stages changed paths.
         if not os.path.exists(f"{self.bf}/.git"):
             if os.path.exists(self.bf):
                 shutil.rmtree(self.bf)
-            os.system(f"git clone {RepoSettings.git_repo} {self.bf}")
+            git.clone(cast(str, RepoSettings.git_repo), self.bf, RepoSettings.git_clone_depth, RepoSettings.git_partial_clone)
         else:
-            os.system(f"cd {self.bf} && git pull")
-        
-        for file in os.listdir(self.bf):
-            if file == ".git": continue
-            path = f"{self.bf}/{file}"
-            if os.path.isdir(path):
-                shutil.rmtree(path)
-            else:
-                os.remove(path)
-
+            git.pull(self.bf, RepoSettings.git_clone_depth)
 
+    @traced()
     def setup_folders(self):
         # Note: could prolly organize this abit better
         # but it's quite nice how it's done in Silica
@@ -103,47 +135,73 @@ class Repo:
             # deb packages. This is 100% technically better in '/assets/' of the tweak,
             # but it's nice to have an easily browsable directory w all tweaks in it.
             "debs",
-            "api", # not required for now tbh.
+            "api/packages", # full data of every tweak (see build_api)
+            "api/pages",
+            "api/search", # see build_search_index
         ):
             if not os.path.exists(f"{self.bf}/{path}"):
                 os.makedirs(f"{self.bf}/{path}")
     
+    @traced(profile=True)
     def copy_static_files(self):
         source_icon = "repo/icon.png" if os.path.exists("repo/icon.png") else "repo/styles/default.png"
-        shutil.copyfile(source_icon, f"{self.bf}/CydiaIcon.png")
+        sync_file(source_icon, f"{self.bf}/CydiaIcon.png", RepoSettings.hardlink_assets)
 
         for file in ("index.css", "index.js"):
-            shutil.copyfile(f"repo/styles/{file}", f"{self.bf}/web/{file}")
+            source = f"repo/styles/{file}"
+            destination = f"{self.bf}/web/{file}"
+            if RepoSettings.minify_outputs:
+                # Minified straight from the source: a synced copy minified in place (by postprocess_outputs) never
+                # matches its source again, so it'd be copied & minified again every build
+                with open(source) as f:
+                    write_file_if_changed(destination, MINIFIERS[os.path.splitext(file)[1]](f.read()).encode())
+            else:
+                sync_file(source, destination, RepoSettings.hardlink_assets)
         
+    @traced()
     def build_cname(self):
         with open(f"{self.bf}/CNAME", "w") as f:
             f.write(RepoSettings.cname)
 
+    def _get_pages(self) -> list[list[Tweak]]:
+        page_size = RepoSettings.index_page_size
+        return [self.tweaks[i:i + page_size] for i in range(0, len(self.tweaks), page_size)] or [[]]
+
+    def _get_pages_context(self) -> dict[str, Any]:
+        # Built once & shared by all pages.
+        # Only the first page of tweaks is rendered, so the pages' size doesn't grow w the repo (see build_api).
+        if self._pages_context is None:
+            pages = self._get_pages()
+            self._pages_context = {
+                "repo_name": RepoSettings.name,
+                "tint_color": RepoSettings.tint,
+                "repo_desc": RepoSettings.description,
+                "repo_url": RepoSettings.get_full_domain(),
+                "featured_tweaks": [t.get_summary() for t in self.featured_tweaks],
+                "tweaks": [t.get_summary() for t in pages[0]],
+                "tweak_count": len(self.tweaks),
+                "page_count": len(pages),
+                "aurixa_version": RepoSettings.aurixa_version,
+                "run_date": RepoSettings.run_date,
+            }
+        return self._pages_context
+
     def _build_html(self, filename: str):
-        environment = jinja2.Environment(loader=jinja2.FileSystemLoader("repo/styles/"))
-        template = environment.get_template(f"{filename}.jinja")
-        content = template.render(
-            repo_name = RepoSettings.name,
-            tint_color = RepoSettings.tint,
-            repo_desc = RepoSettings.description,
-            repo_url = RepoSettings.get_full_domain(),
-            featured_tweaks = [t.to_dictionary() for t in self.featured_tweaks],
-            tweaks = [t.to_dictionary() for t in self.tweaks],
-            aurixa_version = RepoSettings.aurixa_version,
-            run_date = RepoSettings.run_date,
-        )
-        with open(f"{self.bf}/{filename}.html", mode="w") as f:
-            f.write(content)
+        render_template_to_file(f"{filename}.jinja", f"{self.bf}/{filename}.html", **self._get_pages_context())
 
+    @traced(profile=True)
     def build_html_index(self):
        self._build_html("index")
     
+    @traced(profile=True)
     def build_html_404(self):
         self._build_html("404")
 
+    @traced(profile=True)
     def build_html_add(self):
         self._build_html("add")
 
+    @traced(profile=True)
     def build_sileo_featured(self):
         banners = []
 
@@ -166,73 +224,363 @@ class Repo:
         with open(f"{self.bf}/sileo-featured.json", "w") as f:
             json.dump(data, f, indent=4)
         
-    def build_packages_file(self):
-        final_release_text = ""
+    @traced(profile=True)
+    def build_api(self):
+        # Silica like api/:
+        # - tweaks.json: compact summary of every tweak
+        # - pages/<n>.json: same summaries split in pages of index_page_size, lazily loaded by the index
+        # - packages/<id>.json: everything about a tweak, built w its pages (see Tweak.build_api_file())
+        # Files are only rewritten when their content changed.
+        pages = self._get_pages()
+        self._write_api_file("tweaks.json", {
+            "name": RepoSettings.name,
+            "description": RepoSettings.description,
+            "url": RepoSettings.get_full_domain(),
+            "count": len(self.tweaks),
+            "page_size": RepoSettings.index_page_size,
+            "page_count": len(pages),
+            "featured": [t.get_latest_control().get_property("Package") for t in self.featured_tweaks],
+            "tweaks": [t.get_summary() for t in self.tweaks],
+        })
+
+        expected_pages = set()
+        for number, page in enumerate(pages, 1):
+            expected_pages.add(f"{number}.json")
+            self._write_api_file(f"pages/{number}.json", {
+                "page": number,
+                "page_count": len(pages),
+                "tweaks": [t.get_summary() for t in page],
+            })
+        self._remove_stale_api_files("pages", expected_pages)
+
+    @traced(profile=True)
+    def build_search_index(self):
+        # Client side search (see utils/search.py & index.js):
+        # - search/tweaks.json: [package, name, author] of every tweak, all that's needed to show results
+        # - search/<first 2 characters>.json: tokens starting w those characters -> tweaks they're in
+        tweak_tokens = []
+        for tweak in self.tweaks:
+            with open(f"{tweak.meta_folder}/description.md") as f:
+                tweak_tokens.append(get_tweak_tokens(tweak.get_latest_control().get_full_dict(), f.read()))
+        shards = build_search_shards(tweak_tokens)
+
+        summaries = [t.get_summary() for t in self.tweaks]
+        self._write_api_file("search/tweaks.json", [[s["package"], s["name"], s["author"]] for s in summaries])
+        for name, shard in shards.items():
+            self._write_api_file(f"search/{name}.json", shard)
+        self._remove_stale_api_files("search", {"tweaks.json"} | {f"{name}.json" for name in shards})
+
+    def _write_api_file(self, path: str, data: Any):
+        write_file_if_changed(f"{self.bf}/api/{path}", json.dumps(data, separators=(",", ":")).encode())
+
+    def _remove_stale_api_files(self, folder: str, expected_files: set[str]):
+        for file in os.listdir(f"{self.bf}/api/{folder}"):
+            if strip_sidecar_extension(file) not in expected_files:
+                os.remove(f"{self.bf}/api/{folder}/{file}")
+
+    @traced(profile=True)
+    def build_tweaks(self):
+        # Patches the debs & builds the depictions/assets of all tweaks across the worker pool.
+        # Everything is joined before returning, so the Packages file can be built right after.
+        duplicates = self.deduplicate_packages()
+        if any(package.archived for tweak in self.tweaks for package in tweak.packages):
+            os.makedirs(f"{self.bf}/archive/debs", exist_ok=True)
+        jobs: list[BuildJob] = []
+        for tweak in self.tweaks:
+            jobs += tweak.get_build_jobs(self.cache)
+        
+        logging.debug(f"Running {len(jobs)} build jobs on {self.build_workers} workers")
+        run_build_jobs(jobs, self.build_workers)
+
+        if duplicates:
+            saved = sum(os.path.getsize(package.duplicate_of.final_path) for package in duplicates if package.duplicate_of)
+            logging.info(f"{len(duplicates)} duplicate debs only published once, saving {tracing.format_bytes(saved)}")
+
+    @traced()
+    def deduplicate_packages(self) -> list[Package]:
+        """
+        Packages w the same source deb (by content) & the same control make the exact same patched deb & Packages entry,
+        eg the same deb in multiple tweak folders or uploaded again under another name.
+        Only one of them is built, published & listed in the Packages file: the one already published if any
+        (so its url doesn't change), otherwise the first by name.
+        Returns the other ones.
+        """
+        groups: dict[str, list[Package]] = {}
         for tweak in self.tweaks:
             for package in tweak.packages:
-                additional_control_properties = package.hash_patched_file()
-                additional_control_properties["Size"] = str(package.size_patched_file())
-                additional_control_properties["Filename"] = f"./debs/{package.deb_name}"
+                package.duplicate_of = None
+                # Archived packages are published in another folder, can't be merged w the non archived ones
+                key = f"{self.cache.get_content_key(package.initial_path, package.control.to_text())}:{package.archived}"
+                groups.setdefault(key, []).append(package)
+
+        duplicates: list[Package] = []
+        for packages in groups.values():
+            kept = min(packages, key=lambda package: (not os.path.isfile(package.final_path), package.deb_name, package.initial_path))
+            for package in packages:
+                if package is not kept:
+                    logging.debug(f"{package.initial_path} is the same deb as {kept.initial_path}, only publishing the latter")
+                    package.duplicate_of = kept
+                    duplicates.append(package)
+        return duplicates
 
-                final_release_text += package.control.to_text(additional_control_properties) + "\n"
+    @traced(profile=True)
+    def prune_stale_outputs(self):
+        # The build folder isn't wiped anymore, so outputs of removed tweaks/debs need to be removed here.
+        expected_debs = {package.final_path for tweak in self.tweaks for package in tweak.packages if not package.duplicate_of}
+        package_ids = {str(tweak.get_latest_control().get_property("Package")) for tweak in self.tweaks}
+
+        stale_paths: list[str] = []
+        # Archived debs are in archive/debs, see utils/retention.py
+        for folder in ("debs", "archive/debs"):
+            if not os.path.isdir(f"{self.bf}/{folder}"):
+                continue
+            for file in os.listdir(f"{self.bf}/{folder}"):
+                if f"{self.bf}/{folder}/{file}" not in expected_debs:
+                    stale_paths.append(f"{self.bf}/{folder}/{file}")
+        for folder, extension in (("depiction/native", ".json"), ("depiction/web", ".html"), ("api/packages", ".json")):
+            for file in os.listdir(f"{self.bf}/{folder}"):
+                # Precompressed versions (.gz/.br) are removed w their file, see postprocess_outputs()
+                if os.path.isfile(f"{self.bf}/{folder}/{file}") and strip_sidecar_extension(file).removesuffix(extension) not in package_ids:
+                    stale_paths.append(f"{self.bf}/{folder}/{file}")
+        for folder in os.listdir(f"{self.bf}/assets"):
+            if folder not in package_ids:
+                stale_paths.append(f"{self.bf}/assets/{folder}")
         
-        with open(f"{RepoSettings.build_folder}/Packages", 'w') as f:
-            f.write(final_release_text)
-    
-    def compress_packages_file(self):
-        enabled_compressions: dict[str, Callable] = {
-            "xz": lzma.open,
-            "bz2": bz2.open
-        }
+        for tweak in self.tweaks:
+            tweak.prune_screenshot_variants()
+        for path in stale_paths:
+            logging.debug(f"Removing stale output {path}")
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
 
-        with open(f"{RepoSettings.build_folder}/Packages", "rb") as f_in:
-            packages_content = f_in.read()
-            for extension, open_method in enabled_compressions.items():
-                with open_method(f"{RepoSettings.build_folder}/Packages.{extension}", "wb") as f_out:
-                    f_out.write(packages_content)
+    @traced(profile=True)
+    def postprocess_outputs(self):
+        # Minifies & precompresses the built text files, only processing the ones that changed since the last build.
+        minify = RepoSettings.minify_outputs
+        precompress = RepoSettings.precompress_outputs
+        remove_stale_sidecars(self.bf, precompress)
+        if not minify and not precompress:
+            return
+        if precompress and brotli is None:
+            logging.warn("The 'brotli' module isn't installed, only making .gz precompressed files.")
+
+        options = [minify, precompress, POSTPROCESS_VERSION]
+        jobs: list[BuildJob] = []
+        for path in get_postprocessed_files(self.bf, minify, precompress):
+            stat = os.stat(path)
+            cached = self.cache.get_output(path)
+            if cached and cached[:3] == [stat.st_size, stat.st_mtime_ns, options]:
+                continue
+
+            previous_digest = cached[3] if cached and len(cached) == 4 and cached[2] == options else None
+            def on_done(result: tuple[int, int, str], path=path):
+                self.cache.set_output(path, *result, options)
+            jobs.append(BuildJob(f"output {path}", partial(postprocess_file, path, minify, precompress, previous_digest), on_done))
+
+        logging.debug(f"Post processing {len(jobs)} changed outputs")
+        run_build_jobs(jobs, self.build_workers)
+
+    def _get_stanzas(self, archived: bool) -> list[str]:
+        return [
+            cast(str, package.packages_stanza)
+            for tweak in self.tweaks for package in tweak.packages
+            if not package.duplicate_of and package.archived == archived
+        ]
+
+    def _get_cached_packages_files(self, folder: str, stanzas: list[str]) -> tuple[dict[str, tuple[dict[str, str], int]] | None, str]:
+        """
+        Returns filename -> (hashes, size) of the Packages files in folder if they're unchanged (None otherwise),
+        & the sha256 of the stanzas (for _write_packages_files).
+        """
+        # Stanzas are already in memory, hashing them is way cheaper than writing & compressing everything again.
+        packages_sha256 = hashlib.sha256()
+        for stanza in stanzas:
+            packages_sha256.update(f"{stanza}\n".encode())
+
+        cached = self.cache.get_index(os.path.relpath(f"{folder}/Packages", self.bf), packages_sha256.hexdigest(), RepoSettings.compression)
+        unchanged = cached is not None and all(
+            os.path.isfile(f"{folder}/{filename}") and os.path.getsize(f"{folder}/{filename}") == size
+            for filename, (_, size) in cached.items()
+        )
+        tracing.add_cache_result("Packages index", unchanged)
+        return (cached if unchanged else None), packages_sha256.hexdigest()
+
+    def _write_packages_files(self, folder: str, stanzas: list[str], packages_sha256: str) -> dict[str, tuple[dict[str, str], int]]:
+        # Writes the Packages file in folder & all its compressed versions in a single pass.
+        levels = RepoSettings.compression
+        with IndexWriter(f"{folder}/Packages", levels) as writer:
+            for stanza in stanzas:
+                writer.write(f"{stanza}\n")
+
+        tracing.add_bytes(written=sum(size for _, size in writer.results.values()))
+        self.cache.set_index(os.path.relpath(f"{folder}/Packages", self.bf), packages_sha256, levels, writer.results)
+        return writer.results
+
+    @traced(profile=True)
+    def build_packages_file(self):
+        packages_path = f"{RepoSettings.build_folder}/Packages"
+        remove_disabled_formats(packages_path, RepoSettings.compression)
+        if RepoSettings.pdiff_generations <= 0:
+            remove_diffs(f"{packages_path}.diff")
+
+        stanzas = self._get_stanzas(archived=False)
+        cached, packages_sha256 = self._get_cached_packages_files(self.bf, stanzas)
+        if cached:
+            logging.debug("Packages file is unchanged, not writing it again")
+            self.packages_files_hashes.update(cached)
+            self._add_packages_diff_index()
+            return
+
+        # Read before it gets overwritten, it's what the new PDiff patch applies to
+        previous_packages = None
+        if RepoSettings.pdiff_generations > 0 and os.path.isfile(packages_path):
+            with open(packages_path, "rb") as f:
+                previous_packages = f.read()
+
+        results = self._write_packages_files(self.bf, stanzas, packages_sha256)
+        self.packages_files_hashes.update(results)
+
+        if RepoSettings.pdiff_generations > 0:
+            with tracing.span("update_diffs"):
+                new_packages = "".join(f"{stanza}\n" for stanza in stanzas).encode()
+                update_diffs(f"{packages_path}.diff", previous_packages, new_packages, results["Packages"], RepoSettings.pdiff_generations)
+        self._add_packages_diff_index()
+
+    @traced(profile=True)
+    def build_archive(self):
+        # Versions moved out of the main Packages file by the retention policy (see utils/retention.py) are listed
+        # in archive/, a flat repo of its own (w its Release, signed like the main one), so they can still be installed.
+        # No PDiff/by-hash there, it's rarely fetched.
+        archive_folder = f"{self.bf}/archive"
+        stanzas = self._get_stanzas(archived=True)
+        if not stanzas:
+            if os.path.exists(archive_folder):
+                logging.debug("Nothing is archived anymore, removing the archive")
+                shutil.rmtree(archive_folder)
+            return
+
+        remove_disabled_formats(f"{archive_folder}/Packages", RepoSettings.compression)
+        files, packages_sha256 = self._get_cached_packages_files(archive_folder, stanzas)
+        if not files:
+            files = self._write_packages_files(archive_folder, stanzas, packages_sha256)
+        logging.info(f"{len(stanzas)} old versions listed in the archive")
+
+        release = RepoSettings.get_release_string(self._get_hash_sizes_packages_files(files), archive=True)
+        release_changed = write_file_if_changed(f"{archive_folder}/Release", release.encode())
+        if RepoSettings.enable_gpg:
+            self.sign_release_file(release_changed, archive_folder)
+        else:
+            self.remove_release_signatures(archive_folder)
+
+    def _add_packages_diff_index(self):
+        # The Index is tiny, cheaper to hash it again than to keep its hashes around
+        index_path = f"{RepoSettings.build_folder}/Packages.diff/Index"
+        if RepoSettings.pdiff_generations > 0 and os.path.isfile(index_path):
+            self.packages_files_hashes["Packages.diff/Index"] = (hash_file_all_algorithms(index_path), os.path.getsize(index_path))
     
-    def _get_hash_sizes_packages_files(self) -> dict[str, list[tuple[str, int, str]]]:
+    def _get_hash_sizes_packages_files(self, files: dict[str, tuple[dict[str, str], int]] | None = None) -> dict[str, list[tuple[str, int, str]]]:
+        # files: filename -> (hashes, size), the main Packages files by default
         # Format is the following:
         # hash_type: [(hash, size, filename)]
-        files = ("Packages", "Packages.xz", "Packages.bz2")
-
+        # Hashes/sizes were computed while writing the files, no need to read them back.
         res: dict[str, list[tuple[str, int, str]]] = {}
 
-        for file in files:
-            file_path = f"{RepoSettings.build_folder}/{file}"
-            hashes = hash_file_all_algorithms(file_path)
+        for file, (hashes, size) in (self.packages_files_hashes if files is None else files).items():
             for hash_type, hash_value in hashes.items():
                 # Get & make list for current hash if not present
                 current_hash_list = res.get(hash_type)
                 if not current_hash_list:
                     current_hash_list = []
                     res[hash_type] = current_hash_list
-                current_hash_list.append((hash_value, os.path.getsize(file_path), file))
+                current_hash_list.append((hash_value, size, file))
 
         return res
                 
-    def build_release_file(self):
-        with open( f"{RepoSettings.build_folder}/Release", 'w') as f:
-            f.write(RepoSettings.get_release_string(self._get_hash_sizes_packages_files()))
+    @traced()
+    def publish_by_hash(self):
+        # See utils/by_hash.py
+        if RepoSettings.by_hash_generations <= 0:
+            remove_by_hash(self.bf, BY_HASH_FOLDERS)
+            return
+        publish_by_hash(self.bf, self.packages_files_hashes, RepoSettings.by_hash_generations, BY_HASH_FOLDERS)
+
+    @traced()
+    def build_release_file(self) -> bool:
+        """
+        Returns whether the Release file changed (it's left untouched otherwise).
+        """
+        release = RepoSettings.get_release_string(self._get_hash_sizes_packages_files())
+        return write_file_if_changed(f"{self.bf}/Release", release.encode())
     
-    def sign_release_file(self):
-        release_file = f"{self.bf}/Release"
-        gpg_file = f"{release_file}.gpg"
+    @traced()
+    def sign_release_file(self, release_changed: bool = True, folder: str | None = None):
+        # Release.gpg (detached signature) for older clients, InRelease (clearsigned Release) for the others,
+        # which then only need a single request.
+        # folder: the one of the Release file, the build folder by default (see build_archive)
+        folder = folder or self.bf
+        release_file = f"{folder}/Release"
+        signatures = {
+            f"{release_file}.gpg": "--detach-sign",
+            f"{folder}/InRelease": "--clearsign",
+        }
+        # Signatures have a timestamp, signing an unchanged Release again would only make them change for nothing
+        if not release_changed and all(os.path.exists(path) for path in signatures):
+            logging.debug("Release file is unchanged, not signing it again")
+            return
 
-        if os.path.exists(gpg_file):
-            os.remove(gpg_file)
-        
         key = "Aurixa MobileAPT Repository"
-        subprocess.run(f"gpg -abs -u \"{key}\" -o {gpg_file} {release_file}", shell=True, check=True)
+        for path, mode in signatures.items():
+            if os.path.exists(path):
+                os.remove(path)
+            subprocess.run(["gpg", "--batch", "--yes", "--armor", mode, "-u", key, "-o", path, release_file], check=True)
+
+    def remove_release_signatures(self, folder: str | None = None):
+        # Stale signatures (eg gpg got disabled) would make clients use an outdated InRelease
+        folder = folder or self.bf
+        for path in (f"{folder}/Release.gpg", f"{folder}/InRelease"):
+            if os.path.exists(path):
+                os.remove(path)
     
+    @traced(profile=True)
+    def write_build_manifest(self):
+        # Lists the files added/changed/removed by this build (by content, see utils/manifest.py),
+        # for deploy scripts to only upload/purge those.
+        manifest_path = f"{RepoSettings.cache_folder}/build_manifest.json"
+        changes_path = f"{RepoSettings.cache_folder}/build_changes.json"
+        previous = load_manifest(manifest_path)
+        manifest = build_manifest(self.bf, previous)
+        changes = diff_manifests(previous, manifest)
+
+        write_json(changes_path, changes, indent=4)
+        write_json(manifest_path, manifest)
+        logging.info(
+            f"Build changed {len(changes['added']) + len(changes['changed']) + len(changes['removed'])} files "
+            f"({len(changes['added'])} added, {len(changes['changed'])} changed, {len(changes['removed'])} removed), listed in {changes_path}"
+        )
+
+    @traced()
     def prompt_commit(self):
-        if not "y" in log_input("Do you want to commit the changes to your repo?"):
+        changed_paths = git.get_changed_paths(self.bf)
+        if len(changed_paths) == 0:
+            logging.info("Nothing changed in the repo, nothing to commit.")
             return
 
-        commit_message = log_input("Enter your commit message (leave empty for 'Updated repo.'): ").strip()
-        if commit_message == "":
-            commit_message = "[Aurixa] Updated repo."
+        if RepoSettings.auto_commit:
+            commit_message = f"[Aurixa] {RepoSettings.commit_message}"
+        elif not is_interactive():
+            logging.info(f"Not committing the changes ({len(changed_paths)} changed files), 'auto_commit' is disabled.")
+            return
         else:
-            commit_message = "[Aurixa] " + commit_message
+            if not "y" in log_input(f"Do you want to commit the changes to your repo? ({len(changed_paths)} changed files)"):
+                return
+
+            commit_message = log_input(f"Enter your commit message (leave empty for '{RepoSettings.commit_message}'): ").strip()
+            if commit_message == "":
+                commit_message = f"[Aurixa] {RepoSettings.commit_message}"
+            else:
+                commit_message = "[Aurixa] " + commit_message
         
-        os.system(f"cd {RepoSettings.build_folder} && git add . && git commit -m \"{commit_message}\" && git push")
\ No newline at end of file
+        git.commit_paths(self.bf, changed_paths, commit_message)
+        git.push(self.bf)
@@ -1,8 +1,12 @@
 from __future__ import annotations
 from datetime import datetime
+import os
 
 import pyjson5
 
+from utils.compression import get_compression_levels
+from utils.retention import RetentionPolicy, get_retention_policy
+
 class RepoSettings:
     """
     Represents the settings for your repo.
@@ -13,10 +17,30 @@ class RepoSettings:
     https: bool
     cname: str
     git_repo: str | None
+    git_clone_depth: int | None
+    git_partial_clone: bool
+    auto_commit: bool
+    commit_message: str
     enable_gpg: bool
     maintainer_name: str
     maintainer_email: str
     build_folder: str
+    cache_folder: str
+    build_workers: int
+    # extension -> level
+    compression: dict[str, int]
+    # number of PDiff patches kept for the Packages file (0 = disabled)
+    pdiff_generations: int
+    hardlink_assets: bool
+    optimize_images: bool
+    image_scales: list[int]
+    index_page_size: int
+    # number of by-hash generations kept (0 = disabled)
+    by_hash_generations: int
+    # default one for every tweak (None = all versions are kept)
+    retention: RetentionPolicy | None
+    minify_outputs: bool
+    precompress_outputs: bool
     run_date: str
     aurixa_version: str = "1.0" # TODO: MOVE
     
@@ -32,6 +56,13 @@ class RepoSettings:
         cls.cname = data.get("cname")
 
         cls.git_repo = data.get("git_repo", None)
+        # Eg 1 for a shallow clone of the repo (history isn't needed to publish)
+        cls.git_clone_depth = data.get("git_clone_depth", None)
+        # Only download blobs when needed (--filter=blob:none)
+        cls.git_partial_clone = data.get("git_partial_clone", False)
+        # Commit & push changes w commit_message without asking (required to publish from unattended builds)
+        cls.auto_commit = data.get("auto_commit", False)
+        cls.commit_message = data.get("commit_message", "Updated repo.")
         cls.enable_gpg = data.get("enable_gpg", False)
 
         maintainer_part = data.get("maintainer")
@@ -39,6 +70,28 @@ class RepoSettings:
         cls.maintainer_email = maintainer_part.get("email")
 
         cls.build_folder = data.get("build_folder", "www")
+        # Stores data kept between runs (eg build cache), not meant to be uploaded.
+        cls.cache_folder = data.get("cache_folder", "cache")
+        cls.build_workers = data.get("build_workers", os.cpu_count() or 1)
+        # Formats the Packages file gets compressed to (xz, bz2, gz, zst), w their level (null for the default one)
+        cls.compression = get_compression_levels(data.get("compression", {"xz": None, "bz2": None}))
+        # Keep ed style patches between the last Packages files (Packages.diff/), so APT clients only download what changed
+        cls.pdiff_generations = int(data.get("pdiff_generations", 14))
+        # Publish static files & tweak assets as hardlinks instead of copies (when on the same filesystem)
+        cls.hardlink_assets = data.get("hardlink_assets", False)
+        # Publish resized/recompressed images (screenshots at every scale in image_scales, in webp & png) instead of the originals
+        cls.optimize_images = data.get("optimize_images", True)
+        cls.image_scales = sorted(data.get("image_scales", [1, 2, 3]))
+        # Tweaks shown in the first page of the index, the others are loaded lazily (from api/pages/)
+        cls.index_page_size = max(1, int(data.get("index_page_size", 50)))
+        # Publish index files at by-hash/SHA256/<digest> too (so they can be cached forever), keeping that many builds of them
+        cls.by_hash_generations = int(data.get("by_hash_generations", 3))
+        # Versions to keep in the main Packages file, the others are moved to archive/ (see utils/retention.py)
+        cls.retention = get_retention_policy(data.get("retention"), json_path)
+        # Minify the built json/html/css/js files
+        cls.minify_outputs = data.get("minify_outputs", False)
+        # Write .gz/.br versions next to the built text files, for servers serving precompressed files
+        cls.precompress_outputs = data.get("precompress_outputs", False)
         cls.run_date = datetime.now().strftime("%Y-%m-%d")
     
     @classmethod
@@ -47,31 +100,36 @@ class RepoSettings:
         return f"{prefix}://{cls.cname}"
 
     @classmethod
-    def get_release_string(cls, hashes_sizes: dict[str, list[tuple[str, int, str]]]):
+    def get_release_string(cls, hashes_sizes: dict[str, list[tuple[str, int, str]]], archive: bool = False):
+        """
+        archive: for the Release of the archive (old versions, see utils/retention.py)
+        """
         props = {
             "Origin": cls.name,
-            "Label": cls.name,
-            "Suite": "stable",
+            "Label": f"{cls.name} (archive)" if archive else cls.name,
+            "Suite": "archive" if archive else "stable",
             "Version": "1.0", # TODO: allow changing this
             "Codename": "ios", #same
             "Architectures": "iphoneos-arm iphoneos-arm64", # this too (loop over all controls to check if any doesnt have an arch?)
             "Components": "main", # same
             "Description": cls.description
         }
+        if cls.by_hash_generations > 0 and not archive:
+            props["Acquire-By-Hash"] = "yes"
 
         release_str = ""
         for key, value in props.items():
             release_str += f"{key}: {value}\n"
-        release_str += "\n"
 
         # Format:
         # HASH:
         #  <hash> <size in bytes> <filename>
+        # Note: no blank lines, APT only reads the first paragraph of the file (the hashes were ignored,
+        # which also made it skip Packages.diff/)
         for hash_type, hashes_data in hashes_sizes.items():
             release_str += f"{hash_type}:\n"
             for hash_data in hashes_data:
                 release_str += f" {hash_data[0]} {hash_data[1]} {hash_data[2]}\n"
-            release_str += "\n"
         
         return release_str
 
@@ -1,19 +1,34 @@
+import hashlib
 import json
 import logging
 import os
 import shutil
-from typing import cast
-import jinja2
+from functools import partial
+from typing import Any, cast
 import mistune
 from packaging import version
 from packaging.version import Version
+from datatypes.build_cache import BuildCache
+from datatypes.control_index import ControlIndex
 from datatypes.raw.tweak_changelog import TweakChangelog
 from datatypes.package import Package
 from datatypes.raw.tweak_info import TweakInfo
 from datatypes.static.repo_settings import RepoSettings
-from utils.input import blank_log_input, log_input
-from utils.screenshots import get_screenshot_size
-
+from utils.deb import get_deb_changes
+from utils.input import blank_log_input, is_interactive, log_input
+from utils.images import SCREENSHOT_EXTENSIONS, SCREENSHOT_FORMATS, get_png_cache_folder, get_screenshot_cache_folder, get_variant_name, publish_optimized_png, publish_screenshot_variants
+from utils.screenshots import get_screenshot_box, get_screenshot_size
+from utils.report import report_issue
+from utils.sync import sync_file, sync_folder
+from utils.templates import get_template_digest, render_template_to_file
+from utils import tracing
+from utils.tracing import traced
+from utils.workers import BuildJob
+
+
+# Sizes icons & banners are downscaled to when optimizing images (~3x their displayed size)
+ICON_BOX = (256, 256)
+BANNER_BOX = (1280, 720)
 
 class Tweak:
     """
@@ -25,12 +40,17 @@ class Tweak:
     changelog: TweakChangelog
     info: TweakInfo
     screenshots: list[str]
+    # Size the screenshots are displayed at, see load_screenshot_box (called by get_build_jobs)
+    screenshot_box: tuple[int, int] | None
+    _dictionary: dict[str, Any] | None
 
-    def __init__(self, folder_name: str, debs: list[str], do_setup_if_required: bool = True) -> None:
+    def __init__(self, folder_name: str, debs: list[str], do_setup_if_required: bool = True, control_index: ControlIndex | None = None) -> None:
         logging.debug(f"Loading tweak {folder_name}")
         self.folder_name = folder_name
+        self._dictionary = None
+        self.screenshot_box = None
 
-        packages_unsorted = [Package(folder_name, deb) for deb in debs]
+        packages_unsorted = [Package(folder_name, deb, control_index) for deb in debs]
         self.packages = sorted(packages_unsorted, key=lambda package: package.version, reverse=True) #reverse for descending order
 
         self.meta_folder = f"repo/packages/{self.folder_name}/meta"
@@ -40,13 +60,27 @@ class Tweak:
 
         self.changelog = TweakChangelog(f"{self.meta_folder}/changelog.json")
         self.info = TweakInfo(f"{self.meta_folder}/info.json")
+        self.apply_retention_policy()
 
         self.screenshots = []
         if os.path.isdir(f"{self.meta_folder}/screenshots/"):
             for file in os.listdir(f"{self.meta_folder}/screenshots/"):
-                self.screenshots.append(file)
+                if os.path.splitext(file)[1].lower() in SCREENSHOT_EXTENSIONS:
+                    self.screenshots.append(file)
             self.screenshots.sort()
 
+    def apply_retention_policy(self) -> None:
+        # Marks the versions the retention policy doesn't keep as archived (see utils/retention.py).
+        # The latest version is always kept.
+        policy = self.info.retention or RepoSettings.retention
+        versions = sorted({package.version for package in self.packages}, reverse=True)
+        kept_versions = set(versions[:max(1, policy.keep_versions or 0)] if policy else versions)
+        for package in self.packages:
+            kept = package.version in kept_versions
+            if policy and policy.newer_than is not None and not kept:
+                kept = package.get_build_time() >= policy.newer_than
+            package.set_archived(not kept)
+
     def get_latest_control(self):
         return self.packages[0].control
 
@@ -69,12 +103,16 @@ class Tweak:
 
     def setup(self) -> None:
         # Not even sure if adding a "homepage" thing is useful here :/
-        data = {
-            "featured": "y" in log_input("Should the package be featured? (y/n): ").lower(),
-            "source": blank_log_input("Is your package open source? If so, enter the url leave (otherwise leave empty): "),
-            "min_ios": blank_log_input("Enter the lowest iOS version your package is compatible with (can be blank): "),
-            "max_ios": blank_log_input("Enter the highest iOS version your package is compatible with (can be blank): ")
-        }
+        if is_interactive():
+            data = {
+                "featured": "y" in log_input("Should the package be featured? (y/n): ").lower(),
+                "source": blank_log_input("Is your package open source? If so, enter the url leave (otherwise leave empty): "),
+                "min_ios": blank_log_input("Enter the lowest iOS version your package is compatible with (can be blank): "),
+                "max_ios": blank_log_input("Enter the highest iOS version your package is compatible with (can be blank): ")
+            }
+        else:
+            data = {"featured": False, "source": None, "min_ios": None, "max_ios": None}
+            report_issue("tweak_setup", f"Tweak {self.folder_name} had no meta files, made them w default values", tweak=self.folder_name)
         if not os.path.exists(self.meta_folder):
             os.makedirs(self.meta_folder)
         
@@ -100,11 +138,26 @@ class Tweak:
         pass
 
     def to_dictionary(self):
+        # Cached as it's used by every page. Don't modify the returned dict.
+        if self._dictionary is None:
+            self._dictionary = {
+                "control": self.get_latest_control().get_full_dict(),
+                "info": self.info.get_info_dict(),
+                "changelog": self.changelog.data,
+                "screenshots": self.screenshots
+            }
+        return self._dictionary
+
+    def get_summary(self) -> dict[str, Any]:
+        # Compact version of to_dictionary(), used by the index page & the api/ listings
+        control = self.get_latest_control()
         return {
-            "control": self.get_latest_control().get_full_dict(),
-            "info": self.info.get_info_dict(),
-            "changelog": self.changelog.data,
-            "screenshots": self.screenshots
+            "package": control.get_property("Package"),
+            "name": control.get_property("Name"),
+            "author": control.get_property("Author"),
+            "version": control.get_property("Version"),
+            "section": control.get_property("Section"),
+            "description": control.get_property("Description"),
         }
 
     # CHANGELOG
@@ -122,21 +175,180 @@ class Tweak:
         latest_reported_version = self.changelog.get_latest_version_changelog()
 
         if not latest_reported_version or latest_reported_version < latest_version:
-            logging.info(f"Please input your changelog changes for version {latest_version}:")
-            changelog_info = input()
+            # As written in the deb (eg "2.0-1"), which latest_version is a normalized form of ("2.0.post1")
+            control_version = str(self.packages[0].control.get_property("Version"))
+            changelog_info = self._get_version_changes(control_version, latest_version)
+            if changelog_info is None and is_interactive():
+                logging.info(f"Please input your changelog changes for version {latest_version}:")
+                changelog_info = input()
+            elif changelog_info is None:
+                # Not saved, so the changes still get picked up once they're added (the version isn't recorded yet)
+                report_issue(
+                    "missing_changelog",
+                    f"No changes found for {self.folder_name} {control_version} (in meta/changes/{control_version}.md or in the deb)",
+                    tweak=self.folder_name, version=control_version
+                )
+                return
             self.changelog.add_new_version(str(latest_version), changelog_info)
 
+    def _get_version_changes(self, control_version: str, latest_version: Version) -> str | None:
+        """
+        Changes for a new version are taken from 'meta/changes/<version>.md' if it exists (w the version as written in
+        the deb, or its normalized form), otherwise from the Debian changelog shipped in the deb (if any).
+        """
+        for changes_version in dict.fromkeys((control_version, str(latest_version))):
+            changes_path = f"{self.meta_folder}/changes/{changes_version}.md"
+            if os.path.isfile(changes_path):
+                with open(changes_path) as f:
+                    return f.read().strip()
+
+        package = self.packages[0] # latest version
+        return get_deb_changes(package.initial_path, str(package.control.get_property("Package")), control_version)
+
     # BUILDING
-    def build_entire_tweak_in_repo(self):
+    def get_build_jobs(self, cache: BuildCache) -> list[BuildJob]:
+        jobs: list[BuildJob] = []
         for package in self.packages:
-            package.patch_copy_deb_file()
+            package_job = package.get_build_job(cache)
+            if package_job:
+                jobs.append(package_job)
         
+        self.load_screenshot_box(cache)
+        # Made even if the tweak is unchanged, so its cached images are marked as used (& not pruned)
+        image_jobs = self.get_image_jobs(cache)
+
+        # Depictions & assets are only rebuilt when something they're made from changed
+        fingerprint = self.get_fingerprint()
+        unchanged = cache.get_tweak_fingerprint(self.folder_name) == fingerprint and self._tweak_pages_exist()
+        tracing.add_cache_result("tweak pages", unchanged)
+        if unchanged:
+            logging.debug(f"Tweak {self.folder_name} is unchanged, not building its pages again")
+            return jobs
+
+        def on_done(_):
+            cache.set_tweak_fingerprint(self.folder_name, fingerprint)
+
+        jobs += image_jobs
+        jobs.append(BuildJob(f"tweak {self.folder_name}", self.build_tweak_pages, on_done))
+        return jobs
+
+    def get_image_jobs(self, cache: BuildCache) -> list[BuildJob]:
+        # Resizing/recompressing images is heavy, so every image gets its own job.
+        if not RepoSettings.optimize_images:
+            return []
+
+        result_folder = self._get_assets_folder()
+        jobs: list[BuildJob] = []
+        for file, box in (("banner.png", BANNER_BOX), ("icon.png", ICON_BOX)):
+            source_path = self._get_asset_source(file)
+            cache_folder = get_png_cache_folder(cache.get_source_digest(source_path), box)
+            cache.use_image_folder(cache_folder)
+            jobs.append(BuildJob(f"image {source_path}", partial(publish_optimized_png, source_path, cache_folder, f"{result_folder}/{file}", box)))
+
+        box = self.screenshot_box
+        if box:
+            for screenshot in self.screenshots:
+                source_path = f"{self.meta_folder}/screenshots/{screenshot}"
+                cache_folder = get_screenshot_cache_folder(cache.get_source_digest(source_path), box, RepoSettings.image_scales)
+                cache.use_image_folder(cache_folder)
+                jobs.append(BuildJob(f"image {source_path}", partial(publish_screenshot_variants, source_path, cache_folder, f"{result_folder}/screenshots", box, RepoSettings.image_scales)))
+        return jobs
+
+    @traced()
+    def get_fingerprint(self) -> str:
+        """
+        Hash of everything the tweak's depictions & assets are built from.
+        Note: the run date (shown in footers) is left out on purpose, otherwise every tweak would be rebuilt every day.
+        """
+        fingerprint = hashlib.sha256()
+        def add_file_stat(path: str):
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                fingerprint.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+
+        fingerprint.update(json.dumps([
+            self.get_latest_control().get_full_dict(),
+            self.info.get_info_dict(),
+            self.changelog.data,
+            self.screenshots,
+            RepoSettings.tint,
+            RepoSettings.get_full_domain(),
+            RepoSettings.aurixa_version,
+            RepoSettings.optimize_images,
+            RepoSettings.image_scales,
+            get_template_digest("tweak.jinja"),
+        ], sort_keys=True).encode())
+
+        with open(f"{self.meta_folder}/description.md", "rb") as f:
+            fingerprint.update(f.read())
+
+        for file in ("banner.png", "icon.png"):
+            add_file_stat(f"{self.meta_folder}/{file}")
+            add_file_stat(f"repo/styles/default_tweak_assets/{file}")
+        for screenshot in self.screenshots:
+            add_file_stat(f"{self.meta_folder}/screenshots/{screenshot}")
+
+        return fingerprint.hexdigest()
+
+    def _tweak_pages_exist(self) -> bool:
+        package_id = self.get_latest_control().get_property("Package")
+        for path in (
+            f"{RepoSettings.build_folder}/depiction/native/{package_id}.json",
+            f"{RepoSettings.build_folder}/depiction/web/{package_id}.html",
+            f"{RepoSettings.build_folder}/api/packages/{package_id}.json",
+            f"{RepoSettings.build_folder}/assets/{package_id}/icon.png",
+        ):
+            if not os.path.exists(path):
+                return False
+        return True
+
+    def build_tweak_pages(self):
         self.build_native_depiction()
         self.build_native_help_depiction()
         self.build_web_depiction()
+        self.build_api_file()
         self.copy_assets()
         # TODO: help for native depiction in depiction/native/help
 
+    # ASSETS
+    def _get_assets_folder(self) -> str:
+        return f"{RepoSettings.build_folder}/assets/{self.get_latest_control().get_property("Package")}"
+
+    def _get_asset_source(self, file: str) -> str:
+        source_path = f"{self.meta_folder}/{file}"
+        if not os.path.exists(source_path):
+            source_path = f"repo/styles/default_tweak_assets/{file}"
+        return source_path
+
+    def load_screenshot_box(self, cache: BuildCache) -> None:
+        # From the size of the first screenshot, cached by digest so it doesn't need to be opened every build
+        self.screenshot_box = None
+        if self.screenshots:
+            self.screenshot_box = get_screenshot_box(cache.get_image_size(f"{self.meta_folder}/screenshots/{self.screenshots[0]}"))
+
+    def get_screenshot_urls(self) -> list[dict[str, str]]:
+        """
+        Returns the urls to use for every screenshot:
+        - "url": single url (for Sileo), the biggest optimized png if optimizing images, otherwise the original
+        - "png_srcset"/"webp_srcset": srcsets w all sizes (for the web depiction), only if optimizing images
+        """
+        base_url = f"{RepoSettings.get_full_domain()}/assets/{self.get_latest_control().get_property("Package")}/screenshots"
+        urls = []
+        for image in self.screenshots:
+            if not RepoSettings.optimize_images:
+                urls.append({"url": f"{base_url}/{image}"})
+                continue
+
+            stem = os.path.splitext(image)[0]
+            max_scale = max(RepoSettings.image_scales)
+            urls.append({
+                "url": f"{base_url}/{get_variant_name(stem, max_scale, "png")}",
+                "png_srcset": ", ".join(f"{base_url}/{get_variant_name(stem, scale, "png")} {scale}x" for scale in RepoSettings.image_scales),
+                "webp_srcset": ", ".join(f"{base_url}/{get_variant_name(stem, scale, "webp")} {scale}x" for scale in RepoSettings.image_scales),
+            })
+        return urls
+
+    @traced()
     def build_native_depiction(self):
         control = self.get_latest_control()
 
@@ -146,9 +358,9 @@ class Tweak:
         if len(self.screenshots) > 0:
             main_views.append({
                 "class": "DepictionScreenshotsView",
-                "screenshots": [{"accessibilityText": "Screenshot", "url": f"{RepoSettings.get_full_domain()}/assets/{control.get_property("Package")}/screenshots/{image}"} for image in self.screenshots],
+                "screenshots": [{"accessibilityText": "Screenshot", "url": urls["url"]} for urls in self.get_screenshot_urls()],
                 "itemCornerRadius": 8,
-                "itemSize": get_screenshot_size(f"repo/packages/{self.folder_name}/meta/screenshots/")
+                "itemSize": get_screenshot_size(self.screenshot_box)
             })
 
         # Body
@@ -257,46 +469,71 @@ class Tweak:
     def build_native_help_depiction(self):
         logging.warn("TODO: build_native_help_depiction")
     
+    @traced()
     def build_web_depiction(self):
-        environment = jinja2.Environment(loader=jinja2.FileSystemLoader("repo/styles/"))
-        template = environment.get_template("tweak.jinja")
-
         with open(f"{self.meta_folder}/description.md") as f:
             markdown = mistune.markdown(f.read())
 
-        content = template.render(
+        render_template_to_file(
+            "tweak.jinja",
+            f"{RepoSettings.build_folder}/depiction/web/{self.get_latest_control().get_property("Package")}.html",
             tint_color = RepoSettings.tint,
             repo_url = RepoSettings.get_full_domain(),
             tweak = self.to_dictionary(),
+            screenshot_urls = self.get_screenshot_urls(),
             full_description = markdown,
             aurixa_version = RepoSettings.aurixa_version,
             run_date = RepoSettings.run_date,
         )
-
-        with open(f"{RepoSettings.build_folder}/depiction/web/{self.get_latest_control().get_property("Package")}.html", mode="w") as f:
-            f.write(content)
     
+    @traced()
+    def build_api_file(self):
+        # Everything about the tweak, for api/ clients (see Repo.build_api())
+        with open(f"{RepoSettings.build_folder}/api/packages/{self.get_latest_control().get_property("Package")}.json", "w") as f:
+            json.dump(self.to_dictionary(), f, separators=(",", ":"))
+
+    @traced()
     def copy_assets(self):
-        result_folder = f"{RepoSettings.build_folder}/assets/{self.get_latest_control().get_property("Package")}"
-        if not os.path.exists(f"{result_folder}/screenshots"):
-            os.makedirs(f"{result_folder}/screenshots")
+        # Only changed files are written, see utils/sync.py
+        # When optimizing images, pngs & screenshots are published by the image jobs instead.
+        result_folder = self._get_assets_folder()
+        # exist_ok: the image jobs of the tweak run at the same time & make it too
+        os.makedirs(result_folder, exist_ok=True)
         
         meta_folder = f"repo/packages/{self.folder_name}/meta"
-        fallback_folder = f"repo/styles/default_tweak_assets"
+        hardlink = RepoSettings.hardlink_assets
 
         # Copy png files
-        for file in ("banner.png", "icon.png"):
-            source_path = f"{meta_folder}/{file}"
-            if not os.path.exists(source_path):
-                source_path = f"{fallback_folder}/{file}"
-            shutil.copy(source_path, f"{result_folder}/{file}")
+        if not RepoSettings.optimize_images:
+            for file in ("banner.png", "icon.png"):
+                sync_file(self._get_asset_source(file), f"{result_folder}/{file}", hardlink)
         
         # Copy description (no fallback as there should always be one)
-        shutil.copy(f"{meta_folder}/description.md", f"{result_folder}/description.md")
-
-        # Clear old & copy new screenshots
-        if os.path.exists(f"{result_folder}/screenshots"):
-            shutil.rmtree(f"{result_folder}/screenshots")
-        
-        if os.path.exists(f"{meta_folder}/screenshots"):
-            shutil.copytree(f"{meta_folder}/screenshots", f"{result_folder}/screenshots")
+        sync_file(f"{meta_folder}/description.md", f"{result_folder}/description.md", hardlink)
+
+        # Sync screenshots (removing the ones that aren't there anymore)
+        # Note: optimized ones are pruned by prune_screenshot_variants, once the image jobs are done
+        if not RepoSettings.optimize_images and os.path.exists(f"{meta_folder}/screenshots"):
+            sync_folder(f"{meta_folder}/screenshots", f"{result_folder}/screenshots", hardlink)
+
+    def prune_screenshot_variants(self):
+        # Removes the published screenshots that aren't there anymore. Called after all build jobs are done
+        # (see Repo.prune_stale_outputs), the image jobs write to that folder.
+        result_folder = f"{self._get_assets_folder()}/screenshots"
+        if not os.path.exists(result_folder):
+            return
+        if not os.path.exists(f"{self.meta_folder}/screenshots"):
+            shutil.rmtree(result_folder)
+            return
+        if not RepoSettings.optimize_images:
+            return # see copy_assets
+
+        expected_files = set()
+        for image in self.screenshots:
+            stem = os.path.splitext(image)[0]
+            for scale in RepoSettings.image_scales:
+                for extension in SCREENSHOT_FORMATS:
+                    expected_files.add(get_variant_name(stem, scale, extension))
+        for file in os.listdir(result_folder):
+            if file not in expected_files:
+                os.remove(f"{result_folder}/{file}")
@@ -1,24 +1,51 @@
 # TODO: add option to regen GPG keys (prolly)
 
 from update import update_tweaks
+from watch import watch
+from utils import tracing
+from utils.input import set_interactive
 
-def main():
+def main(args):
     logging.info("Welcome to Aurixa's CLI")
+    if not is_setup() and args.non_interactive:
+        logging.error("Your repo isn't setup yet, run Aurixa once without --non-interactive to do it.")
+        exit(1)
     if not is_setup():
         logging.info("Looks like you haven't done the setup for your repo. Starting it.")
         setup()
         if "y" not in log_input("Do you want to process your tweaks now? (y/n): ").lower():
             return
 
-    update_tweaks()
+    if args.trace or args.profile:
+        tracing.enable(args.profile)
+
+    if args.command == "watch":
+        set_interactive(not args.non_interactive)
+        watch(args.jobs, args.report)
+    else:
+        update_tweaks(args.jobs, not args.non_interactive, args.report)
+
+    if tracing.is_enabled():
+        tracing.log_summary()
+        if args.trace:
+            tracing.write_trace(args.trace)
 
 if __name__ == "__main__":
+    import argparse
     import logging
     from setup import is_setup, setup
     from utils.input import log_input
     from utils.logger import load_proper_logger
     load_proper_logger(logging.getLogger(), True)
 
-    main()
+    parser = argparse.ArgumentParser(description="Aurixa's CLI")
+    parser.add_argument("command", nargs="?", choices=["build", "watch"], default="build", help="'build' builds the repo once, 'watch' rebuilds it whenever repo/packages or repo/styles change (without committing)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes used to build the repo (overrides 'build_workers' in repo/settings.json)")
+    parser.add_argument("--non-interactive", action="store_true", help="never ask anything (eg for CI): changelogs come from meta/changes/<version>.md or the debs, issues are written to a build report & committing depends on the 'auto_commit' setting")
+    parser.add_argument("--report", default=None, help="path of the build report (json list of the issues found), default: <cache folder>/build_report.json when using --non-interactive")
+    parser.add_argument("--trace", nargs="?", const="trace.json", default=None, help="write a timeline of the build (Chrome trace format, open it in chrome://tracing or ui.perfetto.dev) to the given path (default: trace.json) & print a summary of every stage")
+    parser.add_argument("--profile", nargs="?", const="profiles", default=None, help="dump cProfile stats of the main build stages (.prof files) to the given folder (default: profiles). Use -j 1 to include the work done by build workers")
+
+    main(parser.parse_args())
 else:
     print("Please run this as a standalone, don't import it.")
\ No newline at end of file
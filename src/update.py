@@ -1,11 +1,55 @@
+from contextlib import contextmanager
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError: # not on unix
+    fcntl = None
+
 from parsers.parse_all_packages import discover_packages
 from datatypes.repo import Repo
+from datatypes.static.repo_settings import RepoSettings
+from utils.input import set_interactive
+from utils.report import write_report
+
+@contextmanager
+def build_lock():
+    # Builds share the build folder & caches, so concurrent runs (eg queued CI jobs) wait for each other.
+    if fcntl is None:
+        yield
+        return
+
+    if not os.path.exists(RepoSettings.cache_folder):
+        os.makedirs(RepoSettings.cache_folder, exist_ok=True)
+    with open(f"{RepoSettings.cache_folder}/build.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.info("Another build is running, waiting for it to finish")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def update_tweaks(build_workers: int | None = None, interactive: bool = True, report_path: str | None = None):
+    """
+    interactive: if False nothing is asked (changelogs come from meta/changes/<version>.md or the debs,
+    issues are reported instead of stopping the build & commits depend on the 'auto_commit' setting).
+    report_path: where to write the build report (json list of issues), defaults to <cache_folder>/build_report.json
+    when not interactive.
+    """
+    set_interactive(interactive)
+
+    with build_lock():
+        repo = Repo(discover_packages(), build_workers)
 
-def update_tweaks():
-    repo = Repo(discover_packages()) 
+        # Could be moved to Repo().__init__() w a flag eg "perform_tweak_updates"
+        for tweak in repo.tweaks:
+            tweak.update_changelog_file()
 
-    # Could be moved to Repo().__init__() w a flag eg "perform_tweak_updates"
-    for tweak in repo.tweaks:
-        tweak.update_changelog_file()
+        repo.build_entire_repo()
 
-    repo.build_entire_repo()
+    if report_path or not interactive:
+        write_report(report_path or f"{RepoSettings.cache_folder}/build_report.json")
@@ -0,0 +1,91 @@
+import logging
+import os
+import shutil
+
+from utils.sync import sync_file, write_file_if_changed
+
+# APT's by-hash layout: every index file is also published at <its folder>/by-hash/SHA256/<its sha256>.
+# Clients fetch the files listed in the Release (w "Acquire-By-Hash: yes") by hash, so those urls never change content
+# & can be cached forever, & a client never gets a Packages file not matching the Release it just downloaded.
+# Previous generations are kept for a while, for clients that got an older Release. They're listed in
+# <folder>/by-hash/generations (published w the rest, like Packages.diff/Index), so pruning doesn't depend on the build cache.
+
+# Only the strongest hash is published, it's the one APT uses
+BY_HASH_ALGORITHM = "SHA256"
+
+
+def get_by_hash_folder(folder: str) -> str:
+    return f"{folder}/by-hash/{BY_HASH_ALGORITHM}"
+
+def _read_generations(path: str) -> list[list[str]]:
+    # One line per generation (oldest first), w its digests separated by spaces (empty once the folder has no files)
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [line.split() for line in f.read().split("\n")[:-1]]
+
+def publish_by_hash(build_folder: str, files: dict[str, tuple[dict[str, str], int]], generations: int, folders: set[str] = set()) -> None:
+    """
+    Publishes the by-hash copies of files (filename relative to build_folder -> (hashes, size)),
+    only the last `generations` builds of them being kept (the others' files are removed).
+    folders: other folders that may have by-hash files from previous builds (eg Packages.diff once PDiffs are disabled),
+    aged out like the others.
+    """
+    # folder -> digest -> filename
+    folders_digests: dict[str, dict[str, str]] = {folder: {} for folder in folders}
+    for filename, (hashes, _) in files.items():
+        folders_digests.setdefault(os.path.dirname(filename), {})[hashes[BY_HASH_ALGORITHM]] = filename
+
+    # folder -> (its existing by-hash files, its generations)
+    states: dict[str, tuple[set[str], list[list[str]]]] = {}
+    for folder, digests in folders_digests.items():
+        source_folder = f"{build_folder}/{folder}" if folder else build_folder
+        by_hash_folder = get_by_hash_folder(source_folder)
+        if not digests and not os.path.exists(f"{source_folder}/by-hash"):
+            continue
+        os.makedirs(by_hash_folder, exist_ok=True)
+
+        existing = set(os.listdir(by_hash_folder))
+        for digest, filename in digests.items():
+            if digest not in existing:
+                # Copied rather than hardlinked: index files are rewritten in place
+                sync_file(f"{build_folder}/{filename}", f"{by_hash_folder}/{digest}")
+
+        folder_generations = _read_generations(f"{source_folder}/by-hash/generations")
+        # Files from unknown generations (eg the generations file is missing) are kept as the oldest one rather than
+        # removed while clients may still need them. They're listed from now on, so they still get pruned later.
+        known = {digest for generation in folder_generations for digest in generation}
+        unknown = sorted(existing - known - set(digests))
+        if unknown:
+            folder_generations.insert(0, unknown)
+        states[folder] = (existing, folder_generations)
+
+    # Generations follow the Release: once any folder changed, they all get a new one (empty for folders w no files
+    # anymore), so files are kept for the last `generations` Releases whatever folder they're in
+    changed = any(not folder_generations or set(folder_generations[-1]) != set(folders_digests[folder]) for folder, (_, folder_generations) in states.items())
+    for folder, (existing, folder_generations) in states.items():
+        source_folder = f"{build_folder}/{folder}" if folder else build_folder
+        by_hash_folder = get_by_hash_folder(source_folder)
+        if changed:
+            folder_generations.append(sorted(folders_digests[folder]))
+        folder_generations = folder_generations[-generations:]
+
+        kept = {digest for generation in folder_generations for digest in generation}
+        if not kept:
+            # Nothing any Release still lists
+            logging.debug(f"Removing {source_folder}/by-hash, no generation has files there anymore")
+            shutil.rmtree(f"{source_folder}/by-hash")
+            if not os.listdir(source_folder):
+                os.rmdir(source_folder)
+            continue
+        for file in existing - kept:
+            logging.debug(f"Removing old by-hash file {by_hash_folder}/{file}")
+            os.remove(f"{by_hash_folder}/{file}")
+        write_file_if_changed(f"{source_folder}/by-hash/generations", "".join(f"{' '.join(generation)}\n" for generation in folder_generations).encode())
+
+def remove_by_hash(build_folder: str, folders: set[str]) -> None:
+    # Once by-hash is disabled
+    for folder in folders:
+        path = f"{build_folder}/{folder}/by-hash" if folder else f"{build_folder}/by-hash"
+        if os.path.exists(path):
+            shutil.rmtree(path)
@@ -0,0 +1,56 @@
+import bz2
+import logging
+import lzma
+import os
+from typing import Any, Callable, Protocol, cast
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class IncrementalCompressor(Protocol):
+    def compress(self, data: bytes, /) -> bytes: ...
+    def flush(self) -> bytes: ...
+
+
+def _make_zst_compressor(level: int) -> IncrementalCompressor:
+    if zstandard is None:
+        raise Exception("The 'zstandard' module is required to compress to zst. Install it or disable the zst compression in your settings.")
+    return cast(IncrementalCompressor, zstandard.ZstdCompressor(level=level).compressobj())
+
+# extension -> (default level, function making a compressor for the given level)
+# All of those release the GIL while compressing, so they can run at the same time on threads.
+COMPRESSORS: dict[str, tuple[int, Callable[[int], IncrementalCompressor]]] = {
+    "xz": (6, lambda level: lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level)),
+    "bz2": (9, lambda level: bz2.BZ2Compressor(level)),
+    # wbits=31 makes a gzip stream (w a fixed header, so the output is deterministic)
+    "gz": (9, lambda level: zlib.compressobj(level, zlib.DEFLATED, 31)),
+    "zst": (19, _make_zst_compressor),
+}
+
+
+def get_compression_levels(settings: dict[str, Any]) -> dict[str, int]:
+    """
+    Validates the "compression" settings ({extension: level or None for the default level}).
+    """
+    levels: dict[str, int] = {}
+    for extension, level in settings.items():
+        compressor = COMPRESSORS.get(extension)
+        if not compressor:
+            logging.warn(f"Unknown compression format in settings: {extension} (valid ones: {', '.join(COMPRESSORS)})")
+            continue
+        if extension == "zst" and zstandard is None:
+            logging.warn("zst compression is enabled but the 'zstandard' module isn't installed, skipping it.")
+            continue
+        levels[extension] = compressor[0] if level is None else int(level)
+    return levels
+
+def remove_disabled_formats(source_path: str, levels: dict[str, int]) -> None:
+    # Avoids leaving eg an old Packages.gz around once gz is disabled
+    for extension in COMPRESSORS:
+        path = f"{source_path}.{extension}"
+        if extension not in levels and os.path.exists(path):
+            os.remove(path)
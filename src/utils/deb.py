@@ -0,0 +1,220 @@
+import gzip
+import io
+import lzma
+import os
+import shutil
+import tarfile
+from typing import IO, cast
+
+import arpy
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+AR_GLOBAL_HEADER = b"!<arch>\n"
+AR_MEMBER_HEADER_SIZE = 60
+# Chunk size used when streaming the (big) data member from one archive to the other
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Supported control member names & the compression used for them.
+# Note: recompression is done manually (instead of using tarfile's "w:gz" modes)
+# so that the output is deterministic (gzip would otherwise embed the current time).
+CONTROL_MEMBERS_COMPRESSION = {
+    b"control.tar.gz": "gz",
+    b"control.tar.xz": "xz",
+    b"control.tar.zst": "zst",
+    b"control.tar": "",
+}
+
+
+def _get_zstandard():
+    if zstandard is None:
+        raise Exception("The 'zstandard' module is required to handle debs w zst members.")
+    return zstandard
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "gz":
+        return gzip.compress(data, mtime=0)
+    if compression == "xz":
+        return lzma.compress(data, format=lzma.FORMAT_XZ)
+    if compression == "zst":
+        return _get_zstandard().ZstdCompressor(level=19).compress(data)
+    return data
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == "gz":
+        return gzip.decompress(data)
+    if compression == "xz":
+        return lzma.decompress(data)
+    if compression == "zst":
+        # Streamed as frames don't always have their decompressed size in them
+        return _get_zstandard().ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    return data
+
+def _ar_member_header(header: arpy.ArchiveFileHeader, size: int) -> bytes:
+    # Format: name(16) mtime(12) uid(6) gid(6) mode(8, octal) size(10) magic(2)
+    return b"%-16s%-12d%-6d%-6d%-8o%-10d`\n" % (
+        header.name,
+        header.timestamp,
+        header.uid or 0,
+        header.gid or 0,
+        header.mode,
+        size
+    )
+
+def _write_ar_member(destination: IO[bytes], header: arpy.ArchiveFileHeader, data: IO[bytes], size: int) -> None:
+    destination.write(_ar_member_header(header, size))
+    shutil.copyfileobj(data, destination, COPY_CHUNK_SIZE)
+    # ar members are 2 bytes aligned
+    if size % 2 == 1:
+        destination.write(b"\n")
+
+def _is_control_file(tarinfo: tarfile.TarInfo) -> bool:
+    return tarinfo.name.removeprefix("./") == "control"
+
+def rebuild_control_tar(control_tar_bin: bytes, compression: str, control_text: str) -> bytes:
+    """
+    Returns a copy of the given (compressed) control tarball with its "control" file replaced by control_text.
+    Every other member (scripts, md5sums, ...) is kept as is.
+    """
+    new_control = control_text.encode()
+    source_tar = tarfile.open(fileobj=io.BytesIO(_decompress(control_tar_bin, compression)))
+
+    new_tar_bin = io.BytesIO()
+    with tarfile.open(fileobj=new_tar_bin, mode="w", format=tarfile.GNU_FORMAT) as new_tar:
+        found_control = False
+        for tarinfo in source_tar.getmembers():
+            if tarinfo.isfile() and _is_control_file(tarinfo):
+                found_control = True
+                tarinfo.size = len(new_control)
+                new_tar.addfile(tarinfo, io.BytesIO(new_control))
+            elif tarinfo.isfile():
+                new_tar.addfile(tarinfo, source_tar.extractfile(tarinfo))
+            else:
+                new_tar.addfile(tarinfo)
+
+        if not found_control:
+            raise Exception("No control file present in the control tarball.")
+
+    return _compress(new_tar_bin.getvalue(), compression)
+
+def patch_deb_control(source_path: str, destination: IO[bytes], control_text: str) -> None:
+    """
+    Writes a copy of the deb at source_path to destination, with its control file replaced by control_text.
+    Only the control member gets rebuilt, the other members (debian-binary & the data tarball)
+    are streamed through byte for byte.
+    """
+    with arpy.Archive(source_path) as source_ar:
+        destination.write(AR_GLOBAL_HEADER)
+        found_control = False
+
+        for member in source_ar:
+            header = member.header
+            compression = CONTROL_MEMBERS_COMPRESSION.get(header.name)
+            if compression is None:
+                _write_ar_member(destination, header, cast(IO[bytes], member), header.size)
+                continue
+
+            found_control = True
+            new_control_tar = rebuild_control_tar(member.read(), compression, control_text)
+            _write_ar_member(destination, header, io.BytesIO(new_control_tar), len(new_control_tar))
+
+        if not found_control:
+            raise Exception(f"No supported control member found in deb {source_path}.")
+
+def read_control_text(deb_path: str) -> str:
+    """
+    Returns the control file of the deb at deb_path.
+    ar headers are read one by one & everything stops at the control member (the 2nd one in standard debs),
+    members before it being skipped w a seek. The data member is never read, so this costs the same whatever the deb's size.
+    """
+    with open(deb_path, "rb") as f:
+        if f.read(len(AR_GLOBAL_HEADER)) != AR_GLOBAL_HEADER:
+            raise Exception(f"{deb_path} isn't a deb (not an ar archive).")
+
+        while True:
+            header = f.read(AR_MEMBER_HEADER_SIZE)
+            if len(header) < AR_MEMBER_HEADER_SIZE:
+                raise Exception(f"No supported control member found in deb {deb_path}.")
+            # Format: name(16) mtime(12) uid(6) gid(6) mode(8) size(10) magic(2). GNU ar names end w a "/".
+            name = header[:16].rstrip(b" ").removesuffix(b"/")
+            size = int(header[48:58])
+
+            compression = CONTROL_MEMBERS_COMPRESSION.get(name)
+            if compression is None:
+                if name.startswith(b"data.tar"):
+                    raise Exception(f"No control member before the data member in deb {deb_path}.")
+                f.seek(size + size % 2, os.SEEK_CUR)
+                continue
+
+            control_tar = tarfile.open(fileobj=io.BytesIO(_decompress(f.read(size), compression)))
+            for tarinfo in control_tar.getmembers():
+                if tarinfo.isfile() and _is_control_file(tarinfo):
+                    return cast(IO[bytes], control_tar.extractfile(tarinfo)).read().decode()
+            raise Exception(f"No control file present in the control tarball of deb {deb_path}.")
+
+def read_build_time(deb_path: str) -> int | None:
+    """
+    Returns when the deb was built (mtime of its first ar member, set by dpkg-deb), or None if it's not set.
+    Unlike the file's mtime, it doesn't change when the deb gets copied/checked out.
+    """
+    with open(deb_path, "rb") as f:
+        if f.read(len(AR_GLOBAL_HEADER)) != AR_GLOBAL_HEADER:
+            raise Exception(f"{deb_path} isn't a deb (not an ar archive).")
+        header = f.read(AR_MEMBER_HEADER_SIZE)
+    try:
+        build_time = int(header[16:28])
+    except ValueError:
+        return None
+    return build_time or None
+
+def _open_data_tar(member: IO[bytes], name: bytes) -> tarfile.TarFile:
+    # Streamed (no seeking), so the data member is only read up to what's needed
+    if name == b"data.tar.zst":
+        return tarfile.open(fileobj=_get_zstandard().ZstdDecompressor().stream_reader(member), mode="r|")
+    return tarfile.open(fileobj=member, mode="r|*")
+
+def read_data_file(deb_path: str, paths: list[str]) -> bytes | None:
+    """
+    Returns the content of the first file installed by the deb matching one of paths, or None if there's none.
+    """
+    wanted = {path.removeprefix("./") for path in paths}
+    with arpy.Archive(deb_path) as source_ar:
+        for member in source_ar:
+            if not member.header.name.startswith(b"data.tar"):
+                continue
+            with _open_data_tar(cast(IO[bytes], member), member.header.name) as data_tar:
+                for tarinfo in data_tar:
+                    if tarinfo.isfile() and tarinfo.name.removeprefix("./") in wanted:
+                        return cast(IO[bytes], data_tar.extractfile(tarinfo)).read()
+            return None
+    return None
+
+def get_deb_changes(deb_path: str, package_id: str, version: str) -> str | None:
+    """
+    Returns the changes for the given version from the Debian changelog shipped in the deb (if any), eg:
+    <package> (<version>) <distribution>; urgency=low
+
+      * Some change
+
+     -- Maintainer <email>  <date>
+    """
+    doc_folder = f"usr/share/doc/{package_id}"
+    data = read_data_file(deb_path, [f"{doc_folder}/{name}" for name in ("changelog.Debian.gz", "changelog.gz", "changelog.Debian", "changelog")])
+    if data is None:
+        return None
+    if data[:2] == b"\x1f\x8b": # gzip magic
+        data = gzip.decompress(data)
+
+    lines = data.decode(errors="replace").splitlines()
+    for i, line in enumerate(lines):
+        if line and not line[0].isspace() and f"({version})" in line:
+            changes = []
+            for entry_line in lines[i + 1:]:
+                if entry_line.startswith(" -- "):
+                    break
+                changes.append(entry_line.strip())
+            return "\n".join(changes).strip() or None
+    return None
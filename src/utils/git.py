@@ -0,0 +1,50 @@
+import logging
+import subprocess
+
+
+def run_git(args: list[str], cwd: str | None = None, input: bytes | None = None) -> bytes:
+    return subprocess.run(["git", *args], cwd=cwd, input=input, stdout=subprocess.PIPE, check=True).stdout
+
+def clone(url: str, folder: str, depth: int | None = None, partial: bool = False) -> None:
+    args = ["clone"]
+    if depth:
+        args += ["--depth", str(depth)]
+    if partial:
+        # Blobs (eg old debs) are only downloaded when actually needed
+        args += ["--filter=blob:none"]
+    run_git([*args, url, folder])
+
+def pull(folder: str, depth: int | None = None) -> None:
+    args = ["pull", "--ff-only"]
+    if depth:
+        args += ["--depth", str(depth)]
+    try:
+        run_git(args, cwd=folder)
+    except subprocess.CalledProcessError:
+        # Eg a freshly made repo w no commits yet
+        logging.warn(f"Couldn't pull the git repo in '{folder}', building on top of its current state.")
+
+def get_changed_paths(folder: str) -> list[str]:
+    """
+    Returns the paths (relative to folder) that differ from the last commit, including deleted & untracked ones.
+    Relies on git's index stat cache: files that weren't rewritten aren't rehashed.
+    """
+    output = run_git(["status", "--porcelain", "-z", "--untracked-files=all", "--no-renames"], cwd=folder)
+    paths = []
+    for entry in output.split(b"\0"):
+        if entry == b"":
+            continue
+        # Format: "XY <path>"
+        paths.append(entry[3:].decode())
+    return paths
+
+def commit_paths(folder: str, paths: list[str], message: str) -> None:
+    """
+    Stages only the given paths (instead of the whole tree) & commits them.
+    """
+    logging.info(f"Staging {len(paths)} changed paths")
+    run_git(["--literal-pathspecs", "add", "--all", "--pathspec-from-file=-", "--pathspec-file-nul"], cwd=folder, input="\0".join(paths).encode())
+    run_git(["commit", "--quiet", "-m", message], cwd=folder)
+
+def push(folder: str) -> None:
+    run_git(["push"], cwd=folder)
@@ -1,27 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
-from typing import Callable
+import os
+from typing import IO, Callable
 
+from utils import tracing
+from utils.tracing import traced
 
-def hash_file_all_algorithms(file_path: str):
-    enabled_hash_algorithms: dict[str, Callable] = {
-        "MD5sum": hashlib.md5,
-        "SHA1": hashlib.sha1,
-        "SHA256": hashlib.sha256
-    }
+# Files are hashed chunk by chunk so memory usage stays bounded no matter the file size
+HASH_CHUNK_SIZE = 1024 * 1024
+# Under that size, dispatching the work to the threads costs more than it saves
+THREADED_HASH_MIN_SIZE = 64 * 1024
 
-    results_obj = {}
-    for name, hash_obj in enabled_hash_algorithms.items():
-        results_obj[name] = hash_obj()
-    
+ENABLED_HASH_ALGORITHMS: dict[str, Callable] = {
+    "MD5sum": hashlib.md5,
+    "SHA1": hashlib.sha1,
+    "SHA256": hashlib.sha256
+}
+
+# hashlib releases the GIL while hashing big enough buffers,
+# so every algorithm gets its own thread.
+# Stored w the pid it's been made in as thread pools don't survive a fork (build workers).
+_hash_threads: tuple[int, ThreadPoolExecutor] | None = None
+
+def _get_hash_threads() -> ThreadPoolExecutor:
+    global _hash_threads
+    if _hash_threads is None or _hash_threads[0] != os.getpid():
+        _hash_threads = (os.getpid(), ThreadPoolExecutor(max_workers=len(ENABLED_HASH_ALGORITHMS), thread_name_prefix="hash"))
+    return _hash_threads[1]
+
+
+class MultiHasher:
+    """
+    Computes all the enabled hashes (& the size) of some data at once.
+    """
+    size: int
+    _hashes: dict[str, "hashlib._Hash"]
+
+    def __init__(self) -> None:
+        self.size = 0
+        self._hashes = {name: algorithm() for name, algorithm in ENABLED_HASH_ALGORITHMS.items()}
+
+    def update(self, data: bytes | memoryview) -> None:
+        self.size += len(data)
+        if len(data) < THREADED_HASH_MIN_SIZE:
+            for hash_obj in self._hashes.values():
+                hash_obj.update(data)
+            return
+
+        futures = [_get_hash_threads().submit(hash_obj.update, data) for hash_obj in self._hashes.values()]
+        for future in futures:
+            future.result()
+
+    def hexdigests(self) -> dict[str, str]:
+        return {name: hash_obj.hexdigest() for name, hash_obj in self._hashes.items()}
+
+
+class HashingWriter:
+    """
+    Wraps a writable binary file & hashes everything written to it,
+    so freshly written files never have to be read back to get their hashes/size.
+    """
+    _file: IO[bytes]
+    hasher: MultiHasher
+
+    def __init__(self, file: IO[bytes]) -> None:
+        self._file = file
+        self.hasher = MultiHasher()
+
+    def write(self, data: bytes | memoryview) -> int:
+        self.hasher.update(data)
+        return self._file.write(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    @property
+    def size(self) -> int:
+        return self.hasher.size
+
+    def hexdigests(self) -> dict[str, str]:
+        return self.hasher.hexdigests()
+
+
+@traced()
+def hash_file_all_algorithms(file_path: str) -> dict[str, str]:
+    tracing.add_bytes(read=os.path.getsize(file_path))
+    hasher = MultiHasher()
     with open(file_path, "rb") as file:
         while True:
-            data = file.read()
+            data = file.read(HASH_CHUNK_SIZE)
             if not data: break
-            for hash_obj in results_obj.values():
-                hash_obj.update(data)
+            hasher.update(data)
 
-    results: dict[str, str] = {}
-    for name, hash_obj in results_obj.items():
-        results[name] = hash_obj.hexdigest()
+    return hasher.hexdigests()
 
-    return results
\ No newline at end of file
+@traced()
+def hash_file_sha256(file_path: str) -> str:
+    tracing.add_bytes(read=os.path.getsize(file_path))
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while True:
+            data = file.read(HASH_CHUNK_SIZE)
+            if not data: break
+            sha256.update(data)
+    return sha256.hexdigest()
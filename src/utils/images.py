@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+
+from PIL import Image
+
+from datatypes.static.repo_settings import RepoSettings
+from utils import tracing
+from utils.sync import sync_file
+
+# Bump when the generated variants change, so old cached ones aren't reused
+IMAGE_CACHE_VERSION = 1
+# Formats every screenshot variant is made in. PNG is kept for clients without WebP support (& Sileo).
+SCREENSHOT_FORMATS = ("webp", "png")
+# Files in meta/screenshots/ taken as screenshots, anything else (eg .DS_Store) is ignored
+SCREENSHOT_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def get_variant_name(stem: str, scale: int, extension: str) -> str:
+    return f"{stem}@{scale}x.{extension}"
+
+def _fit(size: tuple[int, int], box: tuple[int, int]) -> tuple[int, int]:
+    # Biggest size w the same aspect ratio fitting in box, never upscaling.
+    width, height = size
+    ratio = min(box[0] / width, box[1] / height, 1)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+def _save(image: Image.Image, path: str, extension: str) -> None:
+    if extension == "webp":
+        image.save(path, "WEBP", quality=85, method=6)
+    else:
+        image.save(path, "PNG", optimize=True)
+
+def read_image_size(path: str) -> tuple[int, int]:
+    # Only reads the header
+    with Image.open(path) as image:
+        return image.size
+
+def _get_cache_folder(source_digest: str, params: list) -> str:
+    key = hashlib.sha256(json.dumps([source_digest, params, IMAGE_CACHE_VERSION]).encode()).hexdigest()
+    return f"{RepoSettings.cache_folder}/images/{key}"
+
+# Folders the variants of an image are cached in, by source digest (from BuildCache.get_source_digest).
+# Computed before running the jobs, so BuildCache knows which ones are still used.
+def get_screenshot_cache_folder(source_digest: str, box: tuple[int, int], scales: list[int]) -> str:
+    return _get_cache_folder(source_digest, [list(box), scales, SCREENSHOT_FORMATS])
+
+def get_png_cache_folder(source_digest: str, box: tuple[int, int]) -> str:
+    return _get_cache_folder(source_digest, [list(box), "png"])
+
+def _build_cached(cache_folder: str, build) -> dict:
+    """
+    Returns the metadata of the images in cache_folder, calling build(tmp_folder) to make them if they aren't cached yet.
+    """
+    meta_path = f"{cache_folder}/meta.json"
+    tracing.add_cache_result("images", os.path.isfile(meta_path))
+    if os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            return json.load(f)
+
+    tmp_folder = f"{cache_folder}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_folder):
+        shutil.rmtree(tmp_folder)
+    os.makedirs(tmp_folder)
+
+    meta = build(tmp_folder)
+    with open(f"{tmp_folder}/meta.json", "w") as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp_folder, cache_folder)
+    except OSError:
+        # Same image made by another worker in the meantime, keep theirs
+        shutil.rmtree(tmp_folder)
+    return meta
+
+def publish_screenshot_variants(source_path: str, cache_folder: str, destination_folder: str, box: tuple[int, int], scales: list[int]) -> dict:
+    """
+    Publishes resized/recompressed variants of a screenshot ("<name>@<scale>x.<webp|png>") to destination_folder,
+    box being the size (in points) the screenshot is displayed at.
+    Variants are cached in cache_folder (see get_screenshot_cache_folder), so they're only made once.
+    Returns the metadata of the screenshot ({"size": original size, "variants": [filenames]}).
+    """
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+
+    def build(tmp_folder: str) -> dict:
+        variants: list[str] = []
+        with Image.open(source_path) as image:
+            original_size = image.size
+            image = image.convert("RGBA") if image.mode in ("P", "LA", "RGBA") else image.convert("RGB")
+            for scale in scales:
+                resized = image.resize(_fit(original_size, (box[0] * scale, box[1] * scale)), Image.Resampling.LANCZOS)
+                for extension in SCREENSHOT_FORMATS:
+                    name = get_variant_name(stem, scale, extension)
+                    _save(resized, f"{tmp_folder}/{name}", extension)
+                    variants.append(name)
+        return {"size": list(original_size), "variants": variants}
+
+    meta = _build_cached(cache_folder, build)
+    if not os.path.exists(destination_folder):
+        os.makedirs(destination_folder, exist_ok=True)
+    for name in meta["variants"]:
+        # Cached files are never modified in place, so they can always be hardlinked
+        sync_file(f"{cache_folder}/{name}", f"{destination_folder}/{name}", hardlink=True)
+    return meta
+
+def publish_optimized_png(source_path: str, cache_folder: str, destination_path: str, box: tuple[int, int]) -> None:
+    """
+    Publishes source_path (a png) at destination_path, downscaled to fit box & recompressed.
+    The original is published instead if it's already smaller.
+    cache_folder: see get_png_cache_folder
+    """
+
+    def build(tmp_folder: str) -> dict:
+        with Image.open(source_path) as image:
+            original_size = image.size
+            if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+                image = image.convert("RGBA")
+            _save(image.resize(_fit(original_size, box), Image.Resampling.LANCZOS), f"{tmp_folder}/optimized.png", "png")
+        if os.path.getsize(f"{tmp_folder}/optimized.png") >= os.path.getsize(source_path):
+            shutil.copyfile(source_path, f"{tmp_folder}/optimized.png")
+        return {"size": list(original_size), "variants": ["optimized.png"]}
+
+    _build_cached(cache_folder, build)
+    destination_folder = os.path.dirname(destination_path)
+    if not os.path.exists(destination_folder):
+        os.makedirs(destination_folder, exist_ok=True)
+    sync_file(f"{cache_folder}/optimized.png", destination_path, hardlink=True)
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import IO
+
+from utils.compression import COMPRESSORS, IncrementalCompressor
+from utils.hash import HASH_CHUNK_SIZE, HashingWriter
+
+
+class _IndexSink:
+    """
+    One output of the IndexWriter: a file, optionally compressed, hashed as it's written.
+    """
+    filename: str
+    _file: IO[bytes]
+    _writer: HashingWriter
+    _compressor: IncrementalCompressor | None
+
+    def __init__(self, path: str, compressor: IncrementalCompressor | None) -> None:
+        self.filename = os.path.basename(path)
+        self._file = open(path, "wb")
+        self._writer = HashingWriter(self._file)
+        self._compressor = compressor
+
+    def write(self, data: bytes) -> None:
+        if self._compressor:
+            data = self._compressor.compress(data)
+        self._writer.write(data)
+
+    def close(self) -> tuple[dict[str, str], int]:
+        if self._compressor:
+            self._writer.write(self._compressor.flush())
+        self._file.close()
+        return self._writer.hexdigests(), self._writer.size
+
+
+class IndexWriter:
+    """
+    Writes an index file (eg Packages) & all of its compressed versions in a single pass.
+    Data is buffered up to a chunk, which is then handed to every output (plain file & compressors)
+    at the same time on threads, so memory stays bounded whatever the index size.
+    """
+    _sinks: list[_IndexSink]
+    _buffer: list[bytes]
+    _buffer_size: int
+    _threads: ThreadPoolExecutor
+    results: dict[str, tuple[dict[str, str], int]]
+
+    def __init__(self, path: str, levels: dict[str, int]) -> None:
+        self._sinks = [_IndexSink(path, None)]
+        for extension, level in levels.items():
+            self._sinks.append(_IndexSink(f"{path}.{extension}", COMPRESSORS[extension][1](level)))
+
+        self._buffer = []
+        self._buffer_size = 0
+        self._threads = ThreadPoolExecutor(max_workers=len(self._sinks), thread_name_prefix="index")
+        self.results = {}
+
+    def _dispatch(self) -> None:
+        if self._buffer_size == 0:
+            return
+        chunk = b"".join(self._buffer)
+        self._buffer = []
+        self._buffer_size = 0
+
+        futures = [self._threads.submit(sink.write, chunk) for sink in self._sinks]
+        for future in futures:
+            future.result()
+
+    def write(self, text: str) -> None:
+        data = text.encode()
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= HASH_CHUNK_SIZE:
+            self._dispatch()
+
+    def close(self) -> dict[str, tuple[dict[str, str], int]]:
+        """
+        Returns filename -> (hashes, size) for every written file, plain file first.
+        """
+        self._dispatch()
+        futures = [self._threads.submit(sink.close) for sink in self._sinks]
+        for sink, future in zip(self._sinks, futures):
+            self.results[sink.filename] = future.result()
+        self._threads.shutdown()
+        return self.results
+
+    def __enter__(self) -> "IndexWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # Failed midway: don't leave the files open, they'll be overwritten on the next build anyways.
+        self._threads.shutdown()
+        for sink in self._sinks:
+            sink._file.close()
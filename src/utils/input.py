@@ -17,3 +17,13 @@ def blank_log_input(data: str) -> str | None:
     if res == "":
         return None
     return res
+
+# Set to False for unattended builds (eg CI, see update_tweaks()), nothing should ask questions then.
+_interactive = True
+
+def set_interactive(interactive: bool) -> None:
+    global _interactive
+    _interactive = interactive
+
+def is_interactive() -> bool:
+    return _interactive
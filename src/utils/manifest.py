@@ -0,0 +1,54 @@
+import json
+import logging
+import os
+
+from utils.hash import hash_file_sha256
+
+# Manifest of the build folder: relative path -> [size, mtime, sha256].
+# Diffed w the previous one after each build, so deploy scripts know exactly what to upload/purge.
+
+SKIPPED_FOLDERS = {".git"}
+
+
+def load_manifest(path: str) -> dict[str, list]:
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except:
+        logging.warn(f"Couldn't read the build manifest at '{path}', every file will be listed as added.")
+        return {}
+
+def build_manifest(build_folder: str, previous: dict[str, list]) -> dict[str, list]:
+    """
+    Only files whose size or mtime changed since the previous manifest are hashed again.
+    """
+    manifest: dict[str, list] = {}
+    for root, folders, files in os.walk(build_folder):
+        if root == build_folder:
+            folders[:] = [folder for folder in folders if folder not in SKIPPED_FOLDERS]
+        for file in files:
+            path = f"{root}/{file}"
+            relative_path = os.path.relpath(path, build_folder)
+            stat = os.stat(path)
+            entry = previous.get(relative_path)
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                manifest[relative_path] = entry
+            else:
+                manifest[relative_path] = [stat.st_size, stat.st_mtime_ns, hash_file_sha256(path)]
+    return dict(sorted(manifest.items()))
+
+def diff_manifests(previous: dict[str, list], current: dict[str, list]) -> dict[str, list[str]]:
+    # Files rewritten w the same content (same sha256) aren't listed
+    return {
+        "added": [path for path in current if path not in previous],
+        "changed": [path for path, entry in current.items() if path in previous and previous[path][2] != entry[2]],
+        "removed": [path for path in previous if path not in current],
+    }
+
+def write_json(path: str, data: dict, indent: int | None = None) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
@@ -0,0 +1,163 @@
+import json
+import re
+
+# Conservative minifiers: they only remove what can't change how the file is read
+# (comments, indentation & other redundant whitespace), there's no renaming/rewriting of any kind.
+
+_CSS_STRING = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')""")
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+# No space needed around those (":" isn't one of them, "a :hover" & "a:hover" are different selectors)
+_CSS_PUNCTUATION_SPACES = re.compile(r"\s*([{};,>])\s*")
+_CSS_COLON_SPACES = re.compile(r":\s+")
+_HTML_RAW_BLOCK = re.compile(r"<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>", re.S | re.I)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_WHITESPACE = re.compile(r"\s+")
+_HTML_SPACE_BETWEEN_TAGS = re.compile(r"(<!?/?([a-zA-Z0-9]+)[^>]*>)\s+(?=<!?/?([a-zA-Z0-9]+))")
+# Whitespace next to those tags is never rendered (unlike between inline ones, eg "<a>x</a> <a>y</a>")
+_HTML_BLOCK_TAGS = {
+    "doctype", "html", "head", "body", "meta", "link", "title", "script", "style", "div", "p", "br", "hr",
+    "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "section", "header", "footer", "nav", "main", "table", "tr", "td", "th",
+}
+# After those, a "/" starts a regex literal rather than being a division
+_JS_REGEX_PREFIXES = "(,=:[!&|?{};+-*%<>~^"
+# Same after those keywords, eg "return /x/.test(a)"
+_JS_REGEX_KEYWORDS = {
+    "return", "typeof", "instanceof", "case", "in", "of", "delete", "void", "throw", "new", "do", "else", "yield", "await",
+}
+_JS_WORD = re.compile(r"[A-Za-z0-9_$]+")
+
+
+def minify_json(text: str) -> str:
+    return json.dumps(json.loads(text), separators=(",", ":"))
+
+def minify_css(text: str) -> str:
+    # Strings are split out first so that they're kept as is
+    parts = _CSS_STRING.split(_CSS_COMMENT.sub("", text))
+    for i in range(0, len(parts), 2):
+        part = _WHITESPACE.sub(" ", parts[i])
+        part = _CSS_COLON_SPACES.sub(":", part)
+        parts[i] = _CSS_PUNCTUATION_SPACES.sub(r"\1", part).replace(";}", "}")
+    return "".join(parts).strip()
+
+def _skip_string(text: str, i: int) -> int:
+    # Returns the index right after the string/template/regex literal starting at i
+    quote = text[i]
+    i += 1
+    in_class = False # regex character class, eg [/]
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            i += 2
+            continue
+        if quote == "/" and char == "[":
+            in_class = True
+        elif quote == "/" and char == "]":
+            in_class = False
+        elif char == quote and not in_class:
+            return i + 1
+        elif char == "\n" and quote in "'\"/":
+            return i # unterminated, leave the rest alone
+        i += 1
+    return i
+
+def minify_js(text: str) -> str:
+    """
+    Removes comments & indentation. Line breaks are kept (minus empty lines), so automatic semicolon insertion isn't affected.
+    """
+    result: list[str] = []
+    line: list[str] = []
+    # Previous token (punctuation character or whole word), to tell regex literals from divisions
+    last_significant = ""
+    i = 0
+    def end_line():
+        content = "".join(line).strip()
+        if content:
+            result.append(content)
+        line.clear()
+
+    while i < len(text):
+        char = text[i]
+        next_char = text[i + 1] if i + 1 < len(text) else ""
+        if char == "/" and next_char == "/":
+            while i < len(text) and text[i] != "\n":
+                i += 1
+            continue
+        if char == "/" and next_char == "*":
+            end = text.find("*/", i + 2)
+            i = len(text) if end == -1 else end + 2
+            if line and not line[-1].isspace():
+                line.append(" ")
+            continue
+        starts_regex = char == "/" and (
+            last_significant == ""
+            or (len(last_significant) == 1 and last_significant in _JS_REGEX_PREFIXES)
+            or last_significant in _JS_REGEX_KEYWORDS
+        )
+        if char in "'\"`" or starts_regex:
+            end = _skip_string(text, i)
+            line.append(text[i:end])
+            last_significant = text[end - 1]
+            i = end
+            continue
+        if char == "\n":
+            end_line()
+        elif char.isspace():
+            if line and not line[-1].isspace():
+                line.append(" ")
+        elif word := _JS_WORD.match(text, i):
+            line.append(word.group())
+            last_significant = word.group()
+            i = word.end()
+            continue
+        else:
+            line.append(char)
+            last_significant = char
+        i += 1
+    end_line()
+    return "\n".join(result)
+
+def _remove_space_between_tags(match: re.Match) -> str:
+    if match.group(2).lower() in _HTML_BLOCK_TAGS or match.group(3).lower() in _HTML_BLOCK_TAGS:
+        return match.group(1)
+    return match.group(0)
+
+def _minify_html_text(text: str) -> str:
+    text = _WHITESPACE.sub(" ", _HTML_COMMENT.sub("", text))
+    return _HTML_SPACE_BETWEEN_TAGS.sub(_remove_space_between_tags, text)
+
+def minify_html(text: str) -> str:
+    """
+    Collapses whitespace & removes comments outside of <pre>, <textarea>, <script> & <style> blocks.
+    Inline scripts & styles are minified w the js/css minifiers.
+    """
+    parts: list[str] = []
+    position = 0
+    after_block_tag = False # previous part ended w a script/style block, so the space after it can go
+    for match in _HTML_RAW_BLOCK.finditer(text):
+        tag = match.group(1).lower()
+        before = _minify_html_text(text[position:match.start()])
+        if after_block_tag:
+            before = before.lstrip()
+        parts.append(before.rstrip() if tag in ("script", "style") else before)
+
+        block = match.group(0)
+        after_block_tag = tag in ("script", "style")
+        if tag in ("script", "style"):
+            open_end = block.index(">") + 1
+            close_start = block.rindex("<")
+            content = block[open_end:close_start]
+            minified = minify_js(content) if tag == "script" else minify_css(content)
+            block = block[:open_end] + minified + block[close_start:]
+        parts.append(block)
+        position = match.end()
+    after = _minify_html_text(text[position:])
+    parts.append(after.lstrip() if after_block_tag else after)
+    return "".join(parts).strip()
+
+# extension -> minifier
+MINIFIERS = {
+    ".json": minify_json,
+    ".html": minify_html,
+    ".css": minify_css,
+    ".js": minify_js,
+}
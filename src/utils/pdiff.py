@@ -0,0 +1,206 @@
+import difflib
+import gzip
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from utils.hash import MultiHasher
+
+# APT's incremental index updates (PDiffs): Packages.diff/ holds ed style patches, each one going from a previous
+# Packages file to the next one, & an Index listing them. Clients w an old Packages file find its hash in the
+# history & only download the patches from there on (applied in order w APT's "rred" method).
+
+# Hashes listed in the Index (APT doesn't use MD5 there)
+PDIFF_HASHES = ("SHA1", "SHA256")
+
+
+@dataclass
+class PatchEntry:
+    name: str
+    # hashes & size of the Packages file the patch applies to
+    history: tuple[dict[str, str], int]
+    # of the patch itself
+    patch: tuple[dict[str, str], int]
+    # of the gzipped patch (the one actually downloaded)
+    download: tuple[dict[str, str], int]
+
+
+def _hash_data(data: bytes) -> tuple[dict[str, str], int]:
+    hasher = MultiHasher()
+    hasher.update(data)
+    return hasher.hexdigests(), hasher.size
+
+def _split_stanzas(lines: list[bytes]) -> list[tuple[bytes, ...]]:
+    # Each stanza w the blank line ending it, so most of them are unique (they have the deb's hashes)
+    stanzas: list[tuple[bytes, ...]] = []
+    start = 0
+    for i, line in enumerate(lines):
+        if line == b"\n":
+            stanzas.append(tuple(lines[start:i + 1]))
+            start = i + 1
+    if start < len(lines):
+        stanzas.append(tuple(lines[start:]))
+    return stanzas
+
+def make_ed_patch(old: bytes, new: bytes) -> bytes | None:
+    """
+    Returns an ed script turning old into new (like `diff --ed`), or None if it can't be expressed as one.
+    Diffed stanza by stanza rather than line by line: way faster on big indexes, & lines like
+    "Architecture: iphoneos-arm" repeated in every stanza can't confuse the matching.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    # ed can't insert a lone "." line, nor deal w a missing final newline
+    if b".\n" in new_lines or (old and not old.endswith(b"\n")) or (new and not new.endswith(b"\n")):
+        return None
+
+    old_stanzas = _split_stanzas(old_lines)
+    new_stanzas = _split_stanzas(new_lines)
+    # line number (0 based) each old stanza starts at
+    old_offsets = [0]
+    for stanza in old_stanzas:
+        old_offsets.append(old_offsets[-1] + len(stanza))
+
+    commands: list[bytes] = []
+    matcher = difflib.SequenceMatcher(None, old_stanzas, new_stanzas, autojunk=False)
+    # Applied from the end of the file, so line numbers of the earlier commands stay valid
+    for tag, old_start, old_end, new_start, new_end in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        first_line = old_offsets[old_start] + 1
+        last_line = old_offsets[old_end]
+        inserted = b"".join(line for stanza in new_stanzas[new_start:new_end] for line in stanza)
+        line_range = f"{first_line}" if first_line == last_line else f"{first_line},{last_line}"
+        if tag == "delete":
+            commands.append(f"{line_range}d\n".encode())
+        elif tag == "replace":
+            commands.append(f"{line_range}c\n".encode() + inserted + b".\n")
+        else:
+            commands.append(f"{old_offsets[old_start]}a\n".encode() + inserted + b".\n")
+    return b"".join(commands)
+
+def read_diff_index(index_path: str) -> tuple[tuple[dict[str, str], int] | None, list[PatchEntry]]:
+    """
+    Returns the "Current" hashes/size & the patches listed in an existing Index.
+    Anything unreadable is treated as no history at all.
+    """
+    if not os.path.isfile(index_path):
+        return None, []
+
+    fields: dict[str, list[str]] = {}
+    current_field = None
+    with open(index_path) as f:
+        for line in f:
+            if line.startswith(" ") and current_field:
+                fields[current_field].append(line.strip())
+            elif ":" in line:
+                current_field, value = line.split(":", 1)
+                fields[current_field] = [value.strip()] if value.strip() else []
+
+    try:
+        current_hashes: dict[str, str] = {}
+        current_size = 0
+        # name -> kind -> (hashes, size)
+        parsed: dict[str, dict[str, tuple[dict[str, str], int]]] = {}
+        for hash_type in PDIFF_HASHES:
+            hash_value, size = fields[f"{hash_type}-Current"][0].split()
+            current_hashes[hash_type], current_size = hash_value, int(size)
+            for kind in ("History", "Patches", "Download"):
+                for value in fields[f"{hash_type}-{kind}"]:
+                    hash_value, size, filename = value.split()
+                    hashes, _ = parsed.setdefault(filename.removesuffix(".gz"), {}).setdefault(kind, ({}, int(size)))
+                    hashes[hash_type] = hash_value
+        entries = [PatchEntry(name, kinds["History"], kinds["Patches"], kinds["Download"]) for name, kinds in parsed.items()]
+    except (KeyError, IndexError, ValueError):
+        logging.warn(f"Couldn't read the PDiff index at {index_path}, starting a new history.")
+        return None, []
+
+    return (current_hashes, current_size), entries
+
+def _get_index_text(current: tuple[dict[str, str], int], entries: list[PatchEntry]) -> str:
+    text = ""
+    for hash_type in PDIFF_HASHES:
+        text += f"{hash_type}-Current: {current[0][hash_type]} {current[1]}\n"
+    for hash_type in PDIFF_HASHES:
+        for kind, attribute, suffix in (("History", "history", ""), ("Patches", "patch", ""), ("Download", "download", ".gz")):
+            text += f"{hash_type}-{kind}:\n"
+            for entry in entries:
+                hashes, size = getattr(entry, attribute)
+                text += f" {hashes[hash_type]} {size:>12} {entry.name}{suffix}\n"
+    return text
+
+def _get_patch_name(entries: list[PatchEntry]) -> str:
+    # Same naming as Debian's archive, w a counter in case of multiple builds in the same second
+    base_name = datetime.now(timezone.utc).strftime("%Y-%m-%d-%H%M.%S")
+    names = {entry.name for entry in entries}
+    name = base_name
+    counter = 1
+    while name in names:
+        name = f"{base_name}-{counter}"
+        counter += 1
+    return name
+
+def update_diffs(
+    diff_folder: str,
+    old: bytes | None,
+    new: bytes,
+    new_hashes: tuple[dict[str, str], int],
+    generations: int
+) -> None:
+    """
+    Adds a patch from old to new to the history in diff_folder (eg "www/Packages.diff"),
+    keeping only the last `generations` ones, & rewrites its Index.
+    The history is reset if the Index doesn't continue from old (eg the build folder got wiped).
+    """
+    index_path = f"{diff_folder}/Index"
+    current, entries = read_diff_index(index_path)
+
+    if old is None:
+        entries = []
+    else:
+        old_hashes = _hash_data(old)
+        if current is None or any(current[0][hash_type] != old_hashes[0][hash_type] for hash_type in PDIFF_HASHES):
+            if entries:
+                logging.info("Previous Packages file doesn't match the PDiff history, starting a new one.")
+            entries = []
+
+        patch = make_ed_patch(old, new)
+        if patch is None:
+            logging.warn("Couldn't make a PDiff patch for the Packages file, starting a new history.")
+            entries = []
+        else:
+            name = _get_patch_name(entries)
+            download = gzip.compress(patch, 9, mtime=0)
+            if not os.path.exists(diff_folder):
+                os.makedirs(diff_folder)
+            with open(f"{diff_folder}/{name}.gz", "wb") as f:
+                f.write(download)
+            entries.append(PatchEntry(name, old_hashes, _hash_data(patch), _hash_data(download)))
+
+    entries = entries[-generations:]
+    if not entries:
+        remove_diffs(diff_folder)
+        return
+
+    # Removes the patches that got pruned (folders being by-hash/, see utils/by_hash.py)
+    kept_files = {"Index"} | {f"{entry.name}.gz" for entry in entries}
+    for file in os.listdir(diff_folder):
+        if file not in kept_files and os.path.isfile(f"{diff_folder}/{file}"):
+            os.remove(f"{diff_folder}/{file}")
+
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(_get_index_text(new_hashes, entries))
+    os.replace(tmp_path, index_path)
+
+def remove_diffs(diff_folder: str) -> None:
+    # Only the patches & Index, by-hash/ copies of previous Indexes are pruned by utils/by_hash.py
+    # (clients w an older Release may still need them)
+    if not os.path.exists(diff_folder):
+        return
+    for file in os.listdir(diff_folder):
+        if os.path.isfile(f"{diff_folder}/{file}"):
+            os.remove(f"{diff_folder}/{file}")
+    if not os.listdir(diff_folder):
+        os.rmdir(diff_folder)
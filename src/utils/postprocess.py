@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import logging
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from utils import tracing
+from utils.minify import MINIFIERS
+
+# Bump when the minifiers change, so every output gets processed again
+POSTPROCESS_VERSION = 1
+# Files getting precompressed .gz/.br versions next to them (for nginx's gzip_static/brotli_static, Caddy's precompressed, ...)
+PRECOMPRESSED_EXTENSIONS = {".html", ".json", ".css", ".js", ".svg", ".txt", ".md"}
+SIDECAR_EXTENSIONS = (".gz", ".br")
+# Not served to browsers (debs) or handled elsewhere (git)
+SKIPPED_FOLDERS = {".git", "debs"}
+
+
+def strip_sidecar_extension(filename: str) -> str:
+    # "index.html.gz" -> "index.html", only for sidecars of precompressed files (eg not Packages.gz)
+    for extension in SIDECAR_EXTENSIONS:
+        source = filename.removesuffix(extension)
+        if source != filename and os.path.splitext(source)[1] in PRECOMPRESSED_EXTENSIONS:
+            return source
+    return filename
+
+def _walk_files(build_folder: str):
+    for root, folders, files in os.walk(build_folder):
+        if root == build_folder:
+            folders[:] = [folder for folder in folders if folder not in SKIPPED_FOLDERS]
+        for file in files:
+            yield f"{root}/{file}"
+
+def get_postprocessed_files(build_folder: str, minify: bool, precompress: bool) -> list[str]:
+    paths = []
+    for path in _walk_files(build_folder):
+        extension = os.path.splitext(path)[1]
+        if (minify and extension in MINIFIERS) or (precompress and extension in PRECOMPRESSED_EXTENSIONS):
+            paths.append(path)
+    return sorted(paths)
+
+def remove_stale_sidecars(build_folder: str, precompress: bool) -> None:
+    # Sidecars of removed files, or all of them once precompression is disabled
+    for path in _walk_files(build_folder):
+        source = strip_sidecar_extension(path)
+        if source != path and (not precompress or not os.path.exists(source)):
+            logging.debug(f"Removing stale precompressed file {path}")
+            os.remove(path)
+
+def _write_file(path: str, data: bytes) -> None:
+    # Never written in place, the file could be a hardlink (see hardlink_assets)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    tracing.add_bytes(written=len(data))
+
+def _compress(data: bytes, extension: str) -> bytes | None:
+    if extension == ".gz":
+        return gzip.compress(data, 9, mtime=0)
+    if brotli is None:
+        return None
+    return brotli.compress(data, quality=11)
+
+def postprocess_file(path: str, minify: bool, precompress: bool, previous_digest: str | None = None) -> tuple[int, int, str]:
+    """
+    Minifies the file (if it's json/html/css/js) & writes its .gz/.br versions next to it.
+    Files that are always rewritten (eg index.html) often end up w the same content, so compression is skipped
+    if the (minified) content still has previous_digest.
+    Returns the size, mtime & digest of the processed file, used to skip it next time if it didn't change.
+    """
+    extension = os.path.splitext(path)[1]
+    with open(path, "rb") as f:
+        data = f.read()
+    tracing.add_bytes(read=len(data))
+
+    if minify and extension in MINIFIERS:
+        minified = MINIFIERS[extension](data.decode()).encode()
+        if minified != data:
+            data = minified
+            _write_file(path, data)
+
+    digest = hashlib.sha256(data).hexdigest()
+    if precompress and extension in PRECOMPRESSED_EXTENSIONS and digest != previous_digest:
+        for sidecar_extension in SIDECAR_EXTENSIONS:
+            sidecar_path = f"{path}{sidecar_extension}"
+            compressed = _compress(data, sidecar_extension)
+            if compressed is not None and len(compressed) < len(data):
+                _write_file(sidecar_path, compressed)
+            elif os.path.exists(sidecar_path):
+                # Not worth it (tiny file)
+                os.remove(sidecar_path)
+
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, digest
@@ -0,0 +1,37 @@
+import json
+import logging
+import os
+from typing import Any
+
+# Issues found while building (eg a badly ordered changelog), kept so that unattended builds
+# can report them in a machine readable way instead of asking what to do.
+_issues: list[dict[str, Any]] = []
+
+
+def report_issue(kind: str, message: str, **details: Any) -> None:
+    """
+    kind: short identifier of the issue type (eg "changelog_order"), details: anything useful to fix it (eg "path").
+    """
+    logging.warn(message)
+    _issues.append({"kind": kind, "message": message, **details})
+
+def get_issues() -> list[dict[str, Any]]:
+    return list(_issues)
+
+def clear_issues() -> None:
+    _issues.clear()
+
+def write_report(path: str, issues: list[dict[str, Any]] | None = None) -> None:
+    """
+    issues: the ones to write, all the reported ones by default
+    """
+    issues = _issues if issues is None else issues
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"issues": issues}, f, indent=4)
+    os.replace(tmp_path, path)
+    logging.info(f"Build report ({len(issues)} issues) written to {path}")
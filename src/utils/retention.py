@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+# Retention policies, set for every tweak in settings.json & per tweak in their info.json (which takes precedence):
+# "retention": {"keep_versions": 3, "newer_than": "2024-01-01"}
+# Versions matching any of the rules (& always the latest one) stay in the main Packages file,
+# the others are moved to the archive (www/archive/, its own flat repo).
+
+
+@dataclass
+class RetentionPolicy:
+    # Number of most recent versions kept
+    keep_versions: int | None
+    # Versions built on or after that date (unix time) are kept
+    newer_than: float | None
+
+
+def get_retention_policy(data: Any, source: str) -> RetentionPolicy | None:
+    """
+    source: where the policy comes from, for error messages.
+    Returns None if there's no policy (every version is kept).
+    """
+    if not data:
+        return None
+    if not isinstance(data, dict):
+        raise Exception(f"The retention policy in {source} isn't a dict.")
+
+    keep_versions = data.get("keep_versions")
+    if keep_versions is not None and (not isinstance(keep_versions, int) or keep_versions < 1):
+        raise Exception(f"Invalid 'keep_versions' in the retention policy in {source}: {keep_versions} (should be a number, at least 1).")
+
+    newer_than = data.get("newer_than")
+    if newer_than is not None:
+        try:
+            newer_than = datetime.strptime(newer_than, "%Y-%m-%d").timestamp()
+        except (TypeError, ValueError):
+            raise Exception(f"Invalid 'newer_than' in the retention policy in {source}: {newer_than} (should be a YYYY-MM-DD date).")
+
+    if keep_versions is None and newer_than is None:
+        return None
+    return RetentionPolicy(keep_versions, newer_than)
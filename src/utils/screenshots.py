@@ -1,22 +1,19 @@
-import os
-from PIL import Image
-
-def get_screenshot_size(screenshot_folder_path):
-    # Note: this assumes all screenshots are of the same size and only gets the first one
+def get_screenshot_box(size: tuple[int, int]) -> tuple[int, int]:
+    # Size screenshots are displayed at, from the size of the first one (assumes all screenshots are of the same size)
     # ALL CREDITS TO THE SILICA DEV FOR THE LOGIC HERE
-    for file in os.listdir(screenshot_folder_path):
-        if file.lower() == ".ds_store": 
-            continue
+    width, height = size
+    #  Make sure it's not too big.
+    #  If height > width, make height 300, width proportional.
+    #  If height < width, make width 160, height proportional.
+    if height > width:
+        width = round((400 * width)/height)
+        height = 400
+    else:
+        height = round((200 * height) / width)
+        width = 200
+    return width, height
 
-        with Image.open(f"{screenshot_folder_path}/{file}") as img:
-            width, height = img.size
-            #  Make sure it's not too big.
-            #  If height > width, make height 300, width proportional.
-            #  If height < width, make width 160, height proportional.
-            if height > width:
-                width = round((400 * width)/height)
-                height = 400
-            else:
-                height = round((200 * height) / width)
-                width = 200
-            return "{" + str(width) + "," + str(height) + "}"
+def get_screenshot_size(box: tuple[int, int] | None):
+    if box is None:
+        return None
+    return "{" + str(box[0]) + "," + str(box[1]) + "}"
@@ -0,0 +1,59 @@
+import re
+import unicodedata
+
+# Search index used by the web pages (see Repo.build_search_index & index.js).
+# Tokens are split in shards by their first 2 characters, so a search only downloads the shards of the typed words:
+# shard -> {token: [tweak id, weight, tweak id, weight, ...]}
+# Note: tokenize() has to stay in sync w searchTokens() in index.js
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Markdown links/images urls, not something anyone searches for
+_MARKDOWN_URL = re.compile(r"\]\([^)]*\)|https?://\S+")
+# Control field -> weight of the matches in it (a match in the name ranks above one in the description)
+FIELD_WEIGHTS = {
+    "Name": 8,
+    "Package": 4,
+    "Author": 2,
+    "Section": 2,
+    "Description": 1,
+}
+DESCRIPTION_WEIGHT = 1
+SHARD_PREFIX_LENGTH = 2
+
+
+def tokenize(text: str) -> list[str]:
+    # Accents are removed (NFKD), so "é" matches "e". Other non ascii characters split tokens.
+    text = "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char)).lower()
+    return [token for token in _TOKEN.findall(text) if len(token) >= SHARD_PREFIX_LENGTH]
+
+def get_shard_name(token: str) -> str:
+    return token[:SHARD_PREFIX_LENGTH]
+
+def get_tweak_tokens(control: dict[str, str], description_markdown: str) -> dict[str, int]:
+    """
+    Returns token -> weight of its best match for a tweak.
+    """
+    tokens: dict[str, int] = {}
+    def add(text: str, weight: int):
+        for token in tokenize(text):
+            if tokens.get(token, 0) < weight:
+                tokens[token] = weight
+
+    for field, weight in FIELD_WEIGHTS.items():
+        value = control.get(field)
+        if value:
+            add(str(value), weight)
+    add(_MARKDOWN_URL.sub(" ", description_markdown), DESCRIPTION_WEIGHT)
+    return tokens
+
+def build_search_shards(tweak_tokens: list[dict[str, int]]) -> dict[str, dict[str, list[int]]]:
+    """
+    tweak_tokens: tokens of every tweak, the tweak ids being their index in that list.
+    """
+    shards: dict[str, dict[str, list[int]]] = {}
+    for tweak_id, tokens in enumerate(tweak_tokens):
+        for token, weight in tokens.items():
+            postings = shards.setdefault(get_shard_name(token), {}).setdefault(token, [])
+            postings += (tweak_id, weight)
+    # Sorted so the output (& therefore the files) only changes when the index does
+    return {name: dict(sorted(shard.items())) for name, shard in sorted(shards.items())}
@@ -0,0 +1,136 @@
+import logging
+import os
+import shutil
+
+from utils import tracing
+
+try:
+    import fcntl
+except ImportError: # not on unix
+    fcntl = None
+
+# ioctl making dst share src's extents (btrfs, xfs, ...), from linux/fs.h
+FICLONE = 0x40049409
+
+
+def _files_match(source: str, destination: str) -> bool:
+    if not os.path.isfile(destination):
+        return False
+    src_stat = os.stat(source)
+    dst_stat = os.stat(destination)
+    if src_stat.st_ino == dst_stat.st_ino and src_stat.st_dev == dst_stat.st_dev:
+        return True # already hardlinked
+    # mtimes are copied over when publishing, so a match means it's the same file
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+def _try_reflink(source: str, destination: str) -> bool:
+    if fcntl is None:
+        return False
+    with open(source, "rb") as f_src, open(destination, "wb") as f_dst:
+        try:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+            return True
+        except OSError:
+            return False
+
+def _copy_file_range(source: str, destination: str) -> None:
+    # Kernel side copy, no data going through userspace.
+    # Falls back to a regular copy on platforms/filesystems that don't support it.
+    try:
+        with open(source, "rb") as f_src, open(destination, "wb") as f_dst:
+            remaining = os.fstat(f_src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(f_src.fileno(), f_dst.fileno(), remaining)
+                if copied == 0: break
+                remaining -= copied
+        if remaining == 0:
+            return
+    except (AttributeError, OSError):
+        pass
+    shutil.copyfile(source, destination)
+
+def sync_file(source: str, destination: str, hardlink: bool = False) -> bool:
+    """
+    Publishes source at destination if it isn't already there (same size & mtime, or same inode).
+    The file is hardlinked if asked & possible, otherwise reflinked or copied.
+    Returns whether destination was (re)written.
+    """
+    if _files_match(source, destination):
+        tracing.add_cache_result("synced files", True)
+        return False
+    tracing.add_cache_result("synced files", False)
+
+    # Never write in place: destination could be a hardlink to another file.
+    tmp_path = f"{destination}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+
+    linked = False
+    if hardlink:
+        try:
+            os.link(source, tmp_path)
+            linked = True
+        except OSError:
+            logging.debug(f"Couldn't hardlink {source}, copying it instead")
+
+    if not linked:
+        if not _try_reflink(source, tmp_path):
+            _copy_file_range(source, tmp_path)
+        shutil.copystat(source, tmp_path)
+
+    os.replace(tmp_path, destination)
+    tracing.add_bytes(written=os.path.getsize(destination))
+    return True
+
+def sync_folder(source: str, destination: str, hardlink: bool = False) -> int:
+    """
+    Makes destination a mirror of source, only touching changed files & only removing stale ones.
+    Returns the number of (re)written files.
+    """
+    if not os.path.exists(destination):
+        os.makedirs(destination)
+
+    written = 0
+    source_entries = set(os.listdir(source))
+    for entry in source_entries:
+        source_path = f"{source}/{entry}"
+        destination_path = f"{destination}/{entry}"
+        if os.path.isdir(source_path):
+            if os.path.isfile(destination_path):
+                os.remove(destination_path)
+            written += sync_folder(source_path, destination_path, hardlink)
+        else:
+            if os.path.isdir(destination_path):
+                shutil.rmtree(destination_path)
+            written += sync_file(source_path, destination_path, hardlink)
+
+    for entry in os.listdir(destination):
+        if entry in source_entries:
+            continue
+        stale_path = f"{destination}/{entry}"
+        if os.path.isdir(stale_path):
+            shutil.rmtree(stale_path)
+        else:
+            os.remove(stale_path)
+
+    return written
+
+def write_file_if_changed(path: str, data: bytes) -> bool:
+    """
+    Writes data to path unless it already has that exact content, so unchanged outputs keep their mtime
+    (& aren't post processed/committed again).
+    Returns whether the file was (re)written.
+    """
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        with open(path, "rb") as f:
+            if f.read() == data:
+                tracing.add_cache_result("unchanged outputs", True)
+                return False
+    tracing.add_cache_result("unchanged outputs", False)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    tracing.add_bytes(written=len(data))
+    return True
@@ -0,0 +1,123 @@
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tarfile
+
+from PIL import Image
+
+# Note: this doesn't import RepoSettings on purpose, as the settings file doesn't exist yet when generating a repo.
+
+SYNTHETIC_SETTINGS = {
+    "repo_name": "Synthetic Repo",
+    "description": "Generated repo used for benchmarks",
+    "tint": "#FC4C02",
+    "https": True,
+    "cname": "repo.example.com",
+    "git_repo": None,
+    "enable_gpg": False,
+    "maintainer": {"name": "Aurixa", "email": "aurixa@example.com"},
+}
+# Marks folders made by generate_repo, the only ones (w empty ones) it's allowed to wipe.
+# Holds the parameters of the generated repo (see benchmark.py), written as soon as the folder is made.
+MARKER_FILE = "benchmark_parameters.json"
+# Screenshots are made at a typical iPhone resolution
+SCREENSHOT_SIZE = (1170, 2532)
+
+
+def _ar_member(name: str, data: bytes) -> bytes:
+    # Format: name(16) mtime(12) uid(6) gid(6) mode(8, octal) size(10) magic(2), 2 bytes aligned
+    header = b"%-16s%-12d%-6d%-6d%-8o%-10d`\n" % (name.encode(), 0, 0, 0, 0o100644, len(data))
+    return header + data + (b"\n" if len(data) % 2 == 1 else b"")
+
+def _tar_gz(files: dict[str, bytes], compresslevel: int = 9) -> bytes:
+    tar_bin = io.BytesIO()
+    with tarfile.open(fileobj=tar_bin, mode="w", format=tarfile.GNU_FORMAT) as tar:
+        for name, data in files.items():
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.size = len(data)
+            tarinfo.mode = 0o755 if name.endswith(".dylib") else 0o644
+            tar.addfile(tarinfo, io.BytesIO(data))
+    return gzip.compress(tar_bin.getvalue(), compresslevel, mtime=0)
+
+def make_deb(path: str, control: dict[str, str], data_size: int, rng: random.Random) -> None:
+    """
+    Writes a valid deb w the given control & a data member holding a single random (incompressible) file of data_size bytes.
+    """
+    control_text = "".join(f"{key}: {value}\n" for key, value in control.items())
+    control_tar = _tar_gz({"./control": control_text.encode()})
+    # Random data doesn't compress anyways, level 1 keeps generating big repos fast
+    data_tar = _tar_gz({f"./usr/lib/{control['Package']}.dylib": rng.randbytes(data_size)}, 1)
+
+    with open(path, "wb") as f:
+        f.write(b"!<arch>\n")
+        f.write(_ar_member("debian-binary", b"2.0\n"))
+        f.write(_ar_member("control.tar.gz", control_tar))
+        f.write(_ar_member("data.tar.gz", data_tar))
+
+def _make_image(path: str, size: tuple[int, int], rng: random.Random) -> None:
+    # Noisy gradient, so the images don't compress to nothing (unlike a plain color)
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    noise = Image.frombytes("RGB", (size[0] // 8, size[1] // 8), rng.randbytes(size[0] // 8 * (size[1] // 8) * 3)).resize(size)
+    Image.blend(image, noise, 0.3).save(path, "PNG")
+
+def generate_tweak(folder: str, index: int, versions: int, deb_size: int, screenshots: int, rng: random.Random) -> None:
+    package_id = f"com.synthetic.tweak{index}"
+    os.makedirs(f"{folder}/meta")
+
+    changelog = []
+    for minor in range(versions):
+        # Zero padded, as the changelog order check compares versions as strings
+        version = f"1.{minor:03}"
+        make_deb(f"{folder}/{package_id}_{version}_iphoneos-arm.deb", {
+            "Package": package_id,
+            "Name": f"Synthetic Tweak {index}",
+            "Version": version,
+            "Architecture": "iphoneos-arm",
+            "Author": "Aurixa",
+            "Maintainer": "Aurixa <aurixa@example.com>",
+            "Section": "Tweaks",
+            "Depends": "mobilesubstrate",
+            "Description": f"Synthetic tweak number {index}",
+        }, deb_size, rng)
+        changelog.append({"version": version, "changes": f"Changes of version {version}"})
+
+    with open(f"{folder}/meta/info.json", "w") as f:
+        json.dump({"featured": index % 10 == 0, "source": "", "min_ios": "14.0", "max_ios": ""}, f, indent=4)
+    # Latest version last, see TweakChangelog
+    with open(f"{folder}/meta/changelog.json", "w") as f:
+        json.dump(changelog, f, indent=4)
+    with open(f"{folder}/meta/description.md", "w") as f:
+        f.write(f"# Synthetic Tweak {index}\n\n" + "Some **markdown** description, w a [link](https://example.com).\n\n" * 5)
+
+    _make_image(f"{folder}/meta/icon.png", (512, 512), rng)
+    _make_image(f"{folder}/meta/banner.png", (1500, 844), rng)
+    if screenshots > 0:
+        os.makedirs(f"{folder}/meta/screenshots")
+        for screenshot in range(screenshots):
+            _make_image(f"{folder}/meta/screenshots/{screenshot:02}.png", SCREENSHOT_SIZE, rng)
+
+def generate_repo(destination: str, styles_folder: str, tweaks: int, versions: int, deb_size: int, screenshots: int, seed: int = 0) -> None:
+    """
+    Makes a whole repo folder (repo/settings.json, repo/styles & repo/packages) at destination,
+    w tweaks * versions debs of deb_size bytes (roughly, that's the size of their data).
+    Everything is made from seed, so the same parameters always give the same repo.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(destination):
+        if os.listdir(destination) and not os.path.isfile(f"{destination}/{MARKER_FILE}"):
+            raise Exception(f"Not generating a repo in {destination}: it isn't empty & wasn't made by a previous benchmark (no {MARKER_FILE} in it), pick another folder.")
+        shutil.rmtree(destination)
+    os.makedirs(f"{destination}/repo/packages")
+    # Empty parameters until it's fully generated, so an interrupted generation is wiped & made again next time
+    with open(f"{destination}/{MARKER_FILE}", "w") as f:
+        json.dump({}, f)
+    shutil.copytree(styles_folder, f"{destination}/repo/styles")
+
+    with open(f"{destination}/repo/settings.json", "w") as f:
+        json.dump(SYNTHETIC_SETTINGS, f, indent=4)
+
+    for index in range(tweaks):
+        generate_tweak(f"{destination}/repo/packages/Tweak{index}", index, versions, deb_size, screenshots, rng)
@@ -0,0 +1,46 @@
+import hashlib
+import os
+from typing import Any
+
+import jinja2
+
+from datatypes.static.repo_settings import RepoSettings
+from utils import tracing
+from utils.tracing import traced
+
+# One environment per process, shared by every page (so templates are only loaded/compiled once).
+# Compiled templates are also cached on disk between runs.
+_environment: jinja2.Environment | None = None
+_template_digests: dict[str, str] = {}
+
+def get_template_environment() -> jinja2.Environment:
+    global _environment
+    if _environment is None:
+        bytecode_folder = f"{RepoSettings.cache_folder}/jinja"
+        if not os.path.exists(bytecode_folder):
+            os.makedirs(bytecode_folder, exist_ok=True) # exist_ok as build workers can race here
+        _environment = jinja2.Environment(
+            loader=jinja2.FileSystemLoader("repo/styles/"),
+            bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode_folder)
+        )
+    return _environment
+
+@traced()
+def render_template_to_file(template_name: str, path: str, **context: Any) -> None:
+    """
+    Renders the template straight to the file, without building the whole page in memory first.
+    """
+    template = get_template_environment().get_template(template_name)
+    template.stream(**context).dump(path, encoding="utf-8")
+    tracing.add_bytes(written=os.path.getsize(path))
+
+def get_template_digest(template_name: str) -> str:
+    # Used to rebuild pages when their template changes
+    if template_name not in _template_digests:
+        with open(f"repo/styles/{template_name}", "rb") as f:
+            _template_digests[template_name] = hashlib.sha256(f.read()).hexdigest()
+    return _template_digests[template_name]
+
+def reset_template_digests() -> None:
+    # For long running processes (watch mode), templates can change between builds
+    _template_digests.clear()
@@ -0,0 +1,184 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable
+
+# Opt-in build instrumentation (see --trace & --profile in main.py).
+# Spans are recorded as Chrome trace events (open the trace in chrome://tracing or https://ui.perfetto.dev),
+# & summed up per name for the summary table (time, bytes read/written, cache hits/misses).
+# Everything is a no-op when tracing isn't enabled.
+
+_enabled = False
+# Folder .prof files of the profiled spans are dumped to (None = no profiling)
+_profile_folder: str | None = None
+_events: list[dict[str, Any]] = []
+# name -> {"count", "seconds", "bytes_read", "bytes_written", "cache_hits", "cache_misses"}
+_stats: dict[str, dict[str, float]] = {}
+# cache name -> {"cache_hits", "cache_misses"}
+_caches: dict[str, dict[str, int]] = {}
+_lock = threading.Lock()
+# Per thread stack of the open spans, bytes are counted towards the innermost one
+_local = threading.local()
+
+
+def enable(profile_folder: str | None = None) -> None:
+    global _enabled, _profile_folder
+    _enabled = True
+    _profile_folder = profile_folder
+    if profile_folder and not os.path.exists(profile_folder):
+        os.makedirs(profile_folder)
+
+def is_enabled() -> bool:
+    return _enabled
+
+def _now_us() -> float:
+    # perf_counter is system wide on Linux, so events from worker processes line up w the main ones
+    return time.perf_counter_ns() / 1000
+
+def _get_stats(name: str) -> dict[str, float]:
+    stats = _stats.get(name)
+    if stats is None:
+        stats = {"count": 0, "seconds": 0, "bytes_read": 0, "bytes_written": 0, "cache_hits": 0, "cache_misses": 0}
+        _stats[name] = stats
+    return stats
+
+def _get_stack() -> list[str]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+@contextmanager
+def span(name: str, profile: bool = False, stats_name: str | None = None, **args: Any):
+    """
+    Times the code inside it under the given name.
+    profile: also run it under cProfile (if enabled w --profile). Only meant for top level stages,
+    as profilers can't be nested.
+    stats_name: name it's summed up under in the summary (default: name), eg to group all spans of the same kind.
+    """
+    if not _enabled:
+        yield
+        return
+
+    profiler = None
+    if profile and _profile_folder:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    stack = _get_stack()
+    stack.append(stats_name or name)
+    start = _now_us()
+    try:
+        yield
+    finally:
+        duration = _now_us() - start
+        stack.pop()
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(f"{_profile_folder}/{name.replace('/', '_')}.prof")
+
+        with _lock:
+            _events.append({
+                "name": name, "ph": "X", "ts": start, "dur": duration,
+                "pid": os.getpid(), "tid": threading.get_ident(), "args": args
+            })
+            stats = _get_stats(stats_name or name)
+            stats["count"] += 1
+            stats["seconds"] += duration / 1_000_000
+
+def traced(name: str | None = None, profile: bool = False) -> Callable:
+    """
+    Decorator version of span(), named after the function by default.
+    """
+    def decorator(function: Callable) -> Callable:
+        span_name = name or function.__qualname__
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(span_name, profile):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def add_bytes(read: int = 0, written: int = 0) -> None:
+    # Counted towards the innermost open span of the current thread
+    if not _enabled:
+        return
+    stack = _get_stack()
+    if not stack:
+        return
+    with _lock:
+        stats = _get_stats(stack[-1])
+        stats["bytes_read"] += read
+        stats["bytes_written"] += written
+
+def add_cache_result(name: str, hit: bool) -> None:
+    # Counted both under the cache's name & towards the innermost open span
+    if not _enabled:
+        return
+    key = "cache_hits" if hit else "cache_misses"
+    stack = _get_stack()
+    with _lock:
+        _caches.setdefault(name, {"cache_hits": 0, "cache_misses": 0})[key] += 1
+        if stack:
+            _get_stats(stack[-1])[key] += 1
+
+def collect() -> tuple[list[dict[str, Any]], dict[str, dict[str, float]], dict[str, dict[str, int]]]:
+    """
+    Returns & clears what's been recorded so far, used to send what happened in worker processes to the main one.
+    """
+    global _events, _stats, _caches
+    with _lock:
+        recorded = _events, _stats, _caches
+        _events, _stats, _caches = [], {}, {}
+    return recorded
+
+def merge(events: list[dict[str, Any]], stats: dict[str, dict[str, float]], caches: dict[str, dict[str, int]]) -> None:
+    with _lock:
+        _events.extend(events)
+        for name, values in stats.items():
+            current = _get_stats(name)
+            for key, value in values.items():
+                current[key] += value
+        for name, values in caches.items():
+            current_cache = _caches.setdefault(name, {"cache_hits": 0, "cache_misses": 0})
+            for key, value in values.items():
+                current_cache[key] += value
+
+def write_trace(path: str) -> None:
+    with _lock:
+        data = {"traceEvents": sorted(_events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}
+    with open(path, "w") as f:
+        json.dump(data, f)
+    logging.info(f"Build trace written to {path}")
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+def _format_hits(values: dict[str, Any]) -> str:
+    total = values["cache_hits"] + values["cache_misses"]
+    return f"{values['cache_hits']:.0f}/{total:.0f}" if total else ""
+
+def log_summary() -> None:
+    # Note: times of nested spans are also part of their parents' times
+    with _lock:
+        rows = sorted(_stats.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        caches = sorted(_caches.items())
+
+    logging.info(f"{'Stage':<36}{'Count':>7}{'Time (s)':>10}{'Read':>10}{'Written':>10}{'Cache hits':>12}")
+    for name, stats in rows:
+        logging.info(
+            f"{name[:35]:<36}{stats['count']:>7.0f}{stats['seconds']:>10.3f}"
+            f"{format_bytes(stats['bytes_read']):>10}{format_bytes(stats['bytes_written']):>10}{_format_hits(stats):>12}"
+        )
+
+    logging.info(f"{'Cache':<36}{'Hits':>12}")
+    for name, values in caches:
+        logging.info(f"{name[:35]:<36}{_format_hits(values):>12}")
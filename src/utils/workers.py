@@ -0,0 +1,76 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+import logging
+from typing import Any, Callable
+
+from utils import tracing
+
+
+class BuildJobError(Exception):
+    pass
+
+@dataclass
+class BuildJob:
+    # Used to tell which package/tweak made the build fail
+    name: str
+    # Ran in a worker process, so it (& its bound object if any) must be picklable
+    function: Callable[[], Any]
+    # Ran in the main process w the function's result, in the same order the jobs were given
+    on_done: Callable[[Any], None] | None = field(default=None)
+
+
+def _finish_job(job: BuildJob, get_result: Callable[[], Any]) -> None:
+    try:
+        result = get_result()
+    except Exception as e:
+        logging.error(f"Building {job.name} failed.")
+        raise BuildJobError(f"Building {job.name} failed: {e}") from e
+
+    if job.on_done:
+        job.on_done(result)
+
+def _get_stats_name(name: str) -> str:
+    # Jobs are summed up by kind in the tracing summary (eg "deb jobs"), names being "<kind> <path>"
+    return f"{name.split(" ")[0]} jobs"
+
+def _run_traced(name: str, function: Callable[[], Any]) -> tuple[Any, tuple]:
+    # Ran in the worker, sends what's been traced back along w the result.
+    tracing.collect() # drops what's been inherited from the main process (when forked)
+    tracing.enable()
+    with tracing.span(name, stats_name=_get_stats_name(name)):
+        result = function()
+    return result, tracing.collect()
+
+def _get_traced_result(future: Future) -> Any:
+    result, recorded = future.result()
+    tracing.merge(*recorded)
+    return result
+
+def _run_in_span(job: BuildJob) -> Any:
+    with tracing.span(job.name, stats_name=_get_stats_name(job.name)):
+        return job.function()
+
+def run_build_jobs(jobs: list[BuildJob], workers: int) -> None:
+    """
+    Runs all jobs across a process pool of the given size (or directly in this process if workers <= 1),
+    and waits for all of them to be done.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            _finish_job(job, partial(_run_in_span, job))
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        traced = tracing.is_enabled()
+        if traced:
+            futures: list[Future] = [pool.submit(_run_traced, job.name, job.function) for job in jobs]
+        else:
+            futures = [pool.submit(job.function) for job in jobs]
+        try:
+            # Results are consumed in submission order (not completion order) to keep the output deterministic
+            for job, future in zip(jobs, futures):
+                _finish_job(job, partial(_get_traced_result, future) if traced else future.result)
+        except:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
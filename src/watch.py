@@ -0,0 +1,221 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from typing import Any
+
+from datatypes.control_index import ControlIndex
+from datatypes.repo import Repo
+from datatypes.static.repo_settings import RepoSettings
+from datatypes.tweak import Tweak
+from parsers.parse_all_packages import discover_tweak
+from update import build_lock
+from utils.input import is_interactive
+from utils.report import clear_issues, get_issues, write_report
+from utils.templates import reset_template_digests
+
+WATCHED_FOLDERS = ("repo/packages", "repo/styles")
+# Changes are batched until nothing changed for that long (in seconds)
+DEBOUNCE_DELAY = 0.5
+POLLING_INTERVAL = 1.0
+
+# From sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+INOTIFY_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+INOTIFY_EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """
+    Watches folders (recursively) using inotify, Linux only.
+    """
+    _libc: ctypes.CDLL
+    _fd: int
+    _watches: dict[int, str]
+
+    def __init__(self, folders: tuple[str, ...]) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}
+        for folder in folders:
+            self._add_watch_recursive(folder)
+
+    def _add_watch_recursive(self, folder: str) -> None:
+        for root, _, _ in os.walk(folder):
+            wd = self._libc.inotify_add_watch(self._fd, root.encode(), INOTIFY_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {root}")
+            self._watches[wd] = root
+
+    def wait_for_changes(self, timeout: float | None) -> set[str]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed: set[str] = set()
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0").decode()
+            offset += name_len
+
+            folder = self._watches.get(wd)
+            if folder is None:
+                continue
+            path = f"{folder}/{name}" if name else folder
+            changed.add(path)
+            # New folders (eg a new tweak) need their own watch
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                self._add_watch_recursive(path)
+        return changed
+
+
+class PollingWatcher:
+    """
+    Fallback watcher comparing the size/mtime of every file at a regular interval.
+    """
+    _folders: tuple[str, ...]
+    _snapshot: dict[str, tuple[int, int]]
+
+    def __init__(self, folders: tuple[str, ...]) -> None:
+        self._folders = folders
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for folder in self._folders:
+            for root, _, files in os.walk(folder):
+                for file in files:
+                    path = f"{root}/{file}"
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait_for_changes(self, timeout: float | None) -> set[str]:
+        time.sleep(POLLING_INTERVAL if timeout is None else min(timeout, POLLING_INTERVAL))
+        new_snapshot = self._take_snapshot()
+        changed = {path for path in new_snapshot.keys() | self._snapshot.keys() if new_snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = new_snapshot
+        return changed
+
+
+def make_watcher(folders: tuple[str, ...]) -> InotifyWatcher | PollingWatcher:
+    try:
+        return InotifyWatcher(folders)
+    except (OSError, AttributeError) as e:
+        # AttributeError: libc without inotify (not on Linux)
+        logging.warn(f"Couldn't use inotify ({e}), falling back to polling for changes.")
+        return PollingWatcher(folders)
+
+def wait_for_batch(watcher: InotifyWatcher | PollingWatcher) -> set[str]:
+    # Blocks until something changes, then keeps collecting changes until things settle down.
+    changed = watcher.wait_for_changes(None)
+    while True:
+        more_changes = watcher.wait_for_changes(DEBOUNCE_DELAY)
+        if not more_changes:
+            return changed
+        changed |= more_changes
+
+def get_affected_folders(changed_paths: set[str]) -> tuple[set[str], bool]:
+    """
+    Returns the tweak folders affected by the changed paths, & whether styles changed.
+    """
+    folders: set[str] = set()
+    styles_changed = False
+    for path in changed_paths:
+        parts = os.path.normpath(path).split(os.sep)
+        if parts[:2] == ["repo", "styles"]:
+            styles_changed = True
+        elif parts[:2] == ["repo", "packages"] and len(parts) > 2:
+            folders.add(parts[2])
+    return folders, styles_changed
+
+def reload_tweaks(tweaks: dict[str, Tweak], folders: set[str], tweak_issues: dict[str, list[dict[str, Any]]], initial: bool = False) -> None:
+    """
+    tweak_issues: folder -> issues reported while loading it, so the build report still has the ones of the tweaks
+    that weren't reloaded.
+    initial: when loading every tweak for the first build
+    """
+    control_index = ControlIndex(f"{RepoSettings.cache_folder}/control_index.sqlite")
+    for folder in sorted(folders):
+        clear_issues()
+        tweak = discover_tweak(folder, control_index) if os.path.exists(f"repo/packages/{folder}") else None
+        if tweak:
+            if not initial:
+                logging.info(f"Reloaded tweak {folder}")
+            tweak.update_changelog_file()
+            tweaks[folder] = tweak
+            tweak_issues[folder] = get_issues()
+        else:
+            tweak_issues.pop(folder, None)
+            if folder in tweaks:
+                logging.info(f"Tweak {folder} is gone, removing it")
+                del tweaks[folder]
+    control_index.close(prune=initial)
+
+def write_tweaks_report(path: str, tweak_issues: dict[str, list[dict[str, Any]]]) -> None:
+    write_report(path, [issue for folder in sorted(tweak_issues) for issue in tweak_issues[folder]])
+
+def watch(build_workers: int | None = None, report_path: str | None = None):
+    """
+    Builds the repo, then rebuilds it every time something changes in repo/packages or repo/styles.
+    Only the affected tweaks are reloaded, everything else comes from the build caches.
+    Publishing (git) is left out, run a normal build for that.
+    report_path: like in update_tweaks, the report is written after every (re)build
+    """
+    if report_path or not is_interactive():
+        report_path = report_path or f"{RepoSettings.cache_folder}/build_report.json"
+    tweaks: dict[str, Tweak] = {}
+    tweak_issues: dict[str, list[dict[str, Any]]] = {}
+
+    # Every (re)build takes the build lock, so builds started meanwhile (eg main.py build) wait for it & vice versa
+    with build_lock():
+        if not os.path.isdir("repo/packages"):
+            logging.warn("Folder 'packages' either isn't a folder or doesn't exist.")
+        reload_tweaks(tweaks, set(os.listdir("repo/packages")) if os.path.isdir("repo/packages") else set(), tweak_issues, initial=True)
+        Repo([tweaks[folder] for folder in sorted(tweaks)], build_workers).build_entire_repo(publish=False)
+        if report_path:
+            write_tweaks_report(report_path, tweak_issues)
+
+    watcher = make_watcher(WATCHED_FOLDERS)
+    logging.info(f"Watching {', '.join(WATCHED_FOLDERS)} for changes (ctrl+c to stop)")
+    while True:
+        changed_paths = wait_for_batch(watcher)
+        folders, styles_changed = get_affected_folders(changed_paths)
+        if not folders and not styles_changed:
+            continue
+
+        logging.info(f"Rebuilding after changes to {len(changed_paths)} paths")
+        start = time.perf_counter()
+        try:
+            with build_lock():
+                if styles_changed:
+                    reset_template_digests()
+                reload_tweaks(tweaks, folders, tweak_issues)
+                Repo([tweaks[folder] for folder in sorted(tweaks)], build_workers).build_entire_repo(publish=False)
+                if report_path:
+                    write_tweaks_report(report_path, tweak_issues)
+        except Exception:
+            # Keep watching, the error is probably fixed by the next change
+            logging.exception("Rebuild failed")
+            continue
+        logging.info(f"Rebuilt in {time.perf_counter() - start:.2f}s")